@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+"""
+ Stub worker (see worker.py) solving every formula by a single run of a
+ tool, for testing the harness with tools that have no batch mode. The
+ usage of a formula includes the startup of the tool.
+ @title batch-stub.py
+"""
+
+import sys
+import subprocess
+
+import runner
+import events
+import worker
+
+
+def main():
+    if len(sys.argv) < 2:
+        help_err()
+        sys.exit()
+
+    tool = sys.argv[1:]
+    worker.serve(lambda request: solve(tool, request))
+
+
+def solve(tool, request):
+    runner.set_limits(request["limits"]["memory"], request["limits"]["cpu"])
+    try:
+        output, usage = runner.run_tool(tool + request["args"], request["timeout"])
+        return worker.response(events.OK, 0, output, usage)
+    except subprocess.TimeoutExpired as e:
+        return worker.response(events.TIMEOUT, None, e.output, e.usage)
+    except runner.MemoryExpired as e:
+        return worker.response(runner.MEMOUT, None, e.output, e.usage)
+    except subprocess.CalledProcessError as e:
+        return worker.response(events.ERROR, e.returncode, e.output, e.usage)
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./batch-stub.py [tool] [tool arguments]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+"""
+ Benchmark of the accuracy and speed of the predictor against the sizes of
+ automata built by MONA (as collected by mona-stat.py).
+ @title bench-accuracy.py
+"""
+
+import sys
+import getopt
+import os
+import os.path
+import json
+import time
+import importlib
+import subprocess
+
+import numpy
+
+import predict
+import freevars
+import events
+
+monastat = importlib.import_module("mona-stat")
+
+FORMULAS = 400
+REPEAT = 5
+#Relative worsening of the baseline reported as a regression
+TOLERANCE = 0.2
+PERCENTILES = [10, 25, 50, 75, 90]
+
+#Operations of the predictor by the operations of the trace of MONA
+OPERATIONS = {
+    "&": "And",
+    "|": "Or",
+    "=>": "Impl",
+    "<=>": "Biimpl",
+}
+
+VARS = freevars.VarTable()
+
+
+def main():
+    global FORMULAS
+    global REPEAT
+    global TOLERANCE
+    if len(sys.argv) < 4:
+        help_err()
+        sys.exit()
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[4:], "f:r:b:t:m:", ["formulas=", "repeat=", \
+            "baseline=", "tolerance=", "model=", "events="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    baseline = None
+    for o, a in opts:
+        if o in ("-f", "--formulas"):
+            FORMULAS = int(a)
+        if o in ("-r", "--repeat"):
+            REPEAT = int(a)
+        if o in ("-b", "--baseline"):
+            baseline = a
+        if o in ("-t", "--tolerance"):
+            TOLERANCE = float(a)
+        if o in ("-m", "--model"):
+            predict.load_model(a)
+        if o == "--events":
+            events.set_target(a)
+
+    monabin = sys.argv[1]
+    formulafolder = sys.argv[2]
+    resultfile = sys.argv[3]
+
+    print_config()
+    formulas = list()
+    nodes = list()
+    files = get_files(formulafolder)
+    events.sweep(len(files))
+    for family, filename in files:
+        print(filename, end="")
+        sys.stdout.flush()
+        try:
+            with events.task(filename):
+                formula, formula_nodes = measure_file(filename, monabin)
+        except subprocess.TimeoutExpired:
+            print("\tTO")
+            continue
+        except subprocess.CalledProcessError as _:
+            print("\tERROR")
+            continue
+        formula["family"] = family
+        formulas.append(formula)
+        nodes += formula_nodes
+        print("\t{0} / {1}".format(formula["predicted"], formula["actual"]))
+    events.finish()
+
+    results = {"summary": summarize(formulas, nodes), "formulas": formulas}
+    print_summary(results["summary"])
+    with open(resultfile, "w") as handle:
+        json.dump(results, handle, indent=1)
+        handle.write("\n")
+
+    if baseline is not None:
+        with open(baseline, "r") as handle:
+            regressions = compare(json.load(handle)["summary"], results["summary"])
+        for regression in regressions:
+            print("Regression: {0}".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+def get_files(folder):
+    """
+    Get the MONA files of every family (subfolder) of the folder.
+    """
+    files = list()
+    for root, dirs, names in os.walk(folder):
+        dirs.sort()
+        names = sorted(f for f in names if f.endswith(".mona"))[:FORMULAS]
+        family = os.path.relpath(root, folder)
+        files += [(family, os.path.join(root, f)) for f in names]
+    return files
+
+
+def measure_file(filename, monabin):
+    """
+    Predict the size of a formula and build it by MONA. The predicted total
+    size is compared with the sum of the sizes of the atomic automata and of
+    the minimized results of products and projections. Every product and
+    projection is also predicted from the real sizes of its operands.
+    """
+    line = predict.formula_line(filename, monabin)
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        formula = predict.Formula(line)
+    elapsed = (time.perf_counter() - start) / REPEAT
+
+    data, names = monastat.run_mona([monabin, "-i", filename])
+    monastat.fix_variables(data, names)
+    monastat.add_all_freevars(data, names)
+
+    actual = 0
+    nodes = list()
+    for record in data:
+        op = record[0]
+        if op == "init":
+            actual += int(record[11])
+        elif op.startswith("proj"):
+            actual += int(record[11])
+            nodes.append(node_error("Project", record))
+        elif op in OPERATIONS:
+            actual += int(record[11])
+            nodes.append(node_error(OPERATIONS[op], record))
+    return {"file": filename, "predicted": formula.total_size, "actual": actual, \
+        "error": log_error(formula.total_size, actual), "time": elapsed}, nodes
+
+
+def node_error(oper, record):
+    fv1, fv2 = VARS.list_bits(record[3]), VARS.list_bits(record[6])
+    left, right = int(record[2]), int(record[5])
+    if oper in predict.UNARY_OP:
+        predicted = predict.predict_size(oper, left)
+    else:
+        predicted = predict.predict_size(oper, left, right, freevars.shared(fv1, fv2))
+    return log_error(predicted, int(record[11]))
+
+
+def log_error(predicted, actual):
+    #Errors are log2 of the ratio, so over- and underestimates are symmetric
+    return float(numpy.log2(max(predicted, 1)) - numpy.log2(max(actual, 1)))
+
+
+def summarize(formulas, nodes):
+    summary = {
+        "formulas": len(formulas),
+        "nodes": len(nodes),
+        "formula_error": distribution([f["error"] for f in formulas]),
+        "node_error": distribution(nodes),
+        "rank_correlation": rank_correlation([f["predicted"] for f in formulas], \
+            [f["actual"] for f in formulas]),
+        "family_rank_correlation": dict(),
+        "time": float(numpy.mean([f["time"] for f in formulas])) if formulas else None,
+    }
+    for family in sorted(set(f["family"] for f in formulas)):
+        members = [f for f in formulas if f["family"] == family]
+        summary["family_rank_correlation"][family] = rank_correlation( \
+            [f["predicted"] for f in members], [f["actual"] for f in members])
+    return summary
+
+
+def distribution(errors):
+    """
+    Get percentiles of the errors and the mean of their absolute values.
+    """
+    if not errors:
+        return None
+    errors = numpy.array(errors)
+    result = {"p" + str(p): float(v) for p, v in zip(PERCENTILES, numpy.percentile(errors, PERCENTILES))}
+    result["mean_abs"] = float(numpy.mean(numpy.abs(errors)))
+    return result
+
+
+def rank_correlation(x, y):
+    """
+    Spearman's rank correlation, i.e. how well the predictions order the
+    formulas (None if it is not defined).
+    """
+    if len(x) < 2:
+        return None
+    rx, ry = ranks(numpy.array(x, dtype=float)), ranks(numpy.array(y, dtype=float))
+    if numpy.std(rx) == 0 or numpy.std(ry) == 0:
+        return None
+    return float(numpy.corrcoef(rx, ry)[0, 1])
+
+
+def ranks(values):
+    #Equal values get the mean of their ranks
+    order = numpy.argsort(values, kind="stable")
+    ranked = numpy.empty(len(values))
+    ranked[order] = numpy.arange(len(values))
+    _, inverse = numpy.unique(values, return_inverse=True)
+    sums = numpy.bincount(inverse, weights=ranked)
+    return (sums / numpy.bincount(inverse))[inverse]
+
+
+def compare(old, new):
+    """
+    Get the regressions of the new summary against the old one.
+    """
+    regressions = list()
+    for key in ["formula_error", "node_error"]:
+        if old.get(key) and new.get(key) and \
+                new[key]["mean_abs"] > old[key]["mean_abs"]*(1 + TOLERANCE):
+            regressions.append("{0} mean abs {1:.3f} (was {2:.3f})".format(key, \
+                new[key]["mean_abs"], old[key]["mean_abs"]))
+    if old.get("rank_correlation") is not None and new.get("rank_correlation") is not None and \
+            new["rank_correlation"] < old["rank_correlation"] - TOLERANCE:
+        regressions.append("rank correlation {0:.3f} (was {1:.3f})".format( \
+            new["rank_correlation"], old["rank_correlation"]))
+    if old.get("time") and new.get("time") and new["time"] > old["time"]*(1 + TOLERANCE):
+        regressions.append("time per prediction {0:.6f}s (was {1:.6f}s)".format(new["time"], \
+            old["time"]))
+    return regressions
+
+
+def print_summary(summary):
+    print("Formulas: {0}, nodes: {1}".format(summary["formulas"], summary["nodes"]))
+    for key in ["formula_error", "node_error"]:
+        if summary[key] is not None:
+            print("{0} (log2 predicted/actual): {1}".format(key, ", ".join("{0} {1:.3f}".format(k, v) \
+                for k, v in summary[key].items())))
+    print("Rank correlation: {0}".format(summary["rank_correlation"]))
+    for family, correlation in summary["family_rank_correlation"].items():
+        print("  {0}: {1}".format(family, correlation))
+    if summary["time"] is not None:
+        print("Time per prediction: {0:.6f}s".format(summary["time"]))
+
+
+def print_config():
+    print("Timeout: {0}".format(monastat.TIMEOUT))
+    print("Number of formulas per family: {0}".format(FORMULAS))
+    print("Repeat: {0}".format(REPEAT))
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./bench-accuracy.py [mona-bin] [formula folder] " +
+                     "[results file] [--formulas=X] [--repeat=X] [--baseline=FILE] [--tolerance=X] " +
+                     "[--model=FILE] [--events=FILE|tcp:HOST:PORT]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+ Micro-benchmark of the classification of lines of mona -i output.
+ @title bench-classifier.py
+"""
+
+import sys
+import getopt
+import time
+
+import monatrace
+
+REPEAT = 20
+
+INITIAL_AUTOMATA = ["True", "False", "Empty", "FirstOrder", "Const",
+                    "Singleton", "BoolVar", "In(", "Eq1", "Eq2", "Sub2",
+                    "Less1", "LessEq1", "EqPlus2", "EqMinus2", "EqMin",
+                    "EqMax", "EqPlus1", "EqMinus1", "Union", "Inter",
+                    "SetMinus", "EqPlusModulo", "EqMinusModulo", "PresbConst",
+                    "InStateSpace", "Root", "WellFormedTree"]
+
+
+def main():
+    global REPEAT
+    if len(sys.argv) < 2:
+        help_err()
+        sys.exit()
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[2:], "r:", ["repeat="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    for o, a in opts:
+        if o in ("-r", "--repeat"):
+            REPEAT = int(a)
+
+    with open(sys.argv[1], "r") as handle:
+        lines = handle.read().split('\n')
+
+    print("Lines: {0}, repeated {1} times".format(len(lines), REPEAT))
+    print_speed("startswith chain", lines, classify_startswith)
+    print_speed("compiled alternation", lines, classify_compiled)
+
+
+def classify_startswith(line):
+    """
+    Classification done by the original parse_mona in mona-stat.py.
+    """
+    if any([line.startswith(automaton) for automaton in INITIAL_AUTOMATA]):
+        return "init"
+    for prefix in ["Copying", "Replacing indices", "  Minimizing", "Product &",
+                   "Product |", "Product <=>", "Product =>", "Projecting"]:
+        if line.startswith(prefix):
+            return prefix
+    return None
+
+
+def classify_compiled(line):
+    return monatrace.classify(line)[0]
+
+
+def print_speed(name, lines, classify):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for line in lines:
+            classify(line)
+    elapsed = time.perf_counter() - start
+    print("{0: <22} {1:.0f} lines/s".format(name + ":", len(lines)*REPEAT/elapsed))
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./bench-classifier.py [mona -i output] [--repeat=X]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""
+ Benchmark of building predictions of large formula lines.
+ @title bench-formula.py
+"""
+
+import sys
+import getopt
+import time
+
+import predict
+
+SIZES = [10**5, 3*10**5, 10**6]
+
+
+def main():
+    global SIZES
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "s:", ["sizes="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    for o, a in opts:
+        if o in ("-s", "--sizes"):
+            SIZES = [int(size) for size in a.split(",")]
+
+    for size in SIZES:
+        print_speed("deep", deep_formula(size))
+        print_speed("wide", wide_formula(size))
+        print_speed("subst", substituted_formula(size))
+
+
+def deep_formula(length):
+    """
+    A formula nested as deep as its length allows. The implications share
+    their variables, so the predicted sizes stay bounded.
+    """
+    head = list()
+    depth = 0
+    size = 0
+    while size < length:
+        subst = "[#0->#0]" if depth % 10 == 0 else ""
+        head.append("Project(#2,Negate(Impl(Sub2(#0,#1){0},".format(subst))
+        size += len(head[-1]) + 3
+        depth += 1
+    return "".join(head) + "Sub2(#0,#1)" + ")))"*depth
+
+
+def substituted_formula(length):
+    """
+    The deep formula with a substitution enclosing every level, so that the
+    variables of the atoms are renamed by a chain of substitutions as deep
+    as the formula.
+    """
+    head = list()
+    tail = list()
+    depth = 0
+    size = 0
+    while size < length:
+        head.append("Project(#2,Negate(Impl(Sub2(#0,#1),")
+        tail.append(")[#{0}->#{1}]))".format(depth + 3, depth + 4))
+        size += len(head[-1]) + len(tail[-1])
+        depth += 1
+    return "".join(head) + "Sub2(#0,#1)" + "".join(reversed(tail))
+
+
+def wide_formula(length):
+    """
+    A balanced disjunction of atoms over few variables.
+    """
+    atoms = ["Sub2(#{0},#{1})".format(i % 4, (i + 1) % 4) for i in range(length // 16)]
+    while len(atoms) > 1:
+        atoms = ["Or({0},{1})".format(atoms[i], atoms[i + 1]) if i + 1 < len(atoms) else atoms[i] \
+            for i in range(0, len(atoms), 2)]
+    return atoms[0]
+
+
+def print_speed(name, formula):
+    start = time.perf_counter()
+    tree = predict.Formula(formula)
+    elapsed = time.perf_counter() - start
+    print("{0: <5} {1: >8} chars: {2:.2f}s, {3:.0f} chars/s, total size {4}".format(name, \
+        len(formula), elapsed, len(formula)/elapsed, tree.total_size))
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./bench-formula.py [--sizes=X,Y,...]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+ Benchmark of predictions with the native parser, with mona -a and in batches.
+ @title bench-predict.py
+"""
+
+import sys
+import getopt
+import os
+import os.path
+import time
+import subprocess
+
+import monaformula
+import predict
+
+REPEAT = 5
+
+
+def main():
+    global REPEAT
+    if len(sys.argv) < 3:
+        help_err()
+        sys.exit()
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[3:], "r:", ["repeat="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    for o, a in opts:
+        if o in ("-r", "--repeat"):
+            REPEAT = int(a)
+
+    monabin = sys.argv[1]
+    formulafolder = sys.argv[2]
+    files = [os.path.join(formulafolder, f) for f in predict.get_files(formulafolder)]
+
+    supported = list()
+    for filename in files:
+        try:
+            monaformula.parse_file(filename)
+            supported.append(filename)
+        except monaformula.UnsupportedFormula as e:
+            print("Unsupported: {0} ({1})".format(os.path.basename(filename), e))
+
+    print("Formulas: {0}, natively parsed: {1}, repeated {2} times".format(len(files), \
+        len(supported), REPEAT))
+    check_sizes(supported, monabin)
+    print_speed("native", supported, predict_native)
+    print_speed("mona -a", supported, lambda filename: predict_mona(filename, monabin))
+    print_batch_speed("batch", supported)
+
+
+def predict_native(filename):
+    return predict.Formula(monaformula.parse_file(filename)).total_size
+
+
+def predict_mona(filename, monabin):
+    mona_output = predict.process_file(filename, monabin)
+    return predict.Formula(mona_output.split('\n')[-1]).total_size
+
+
+def predict_batch(files):
+    return predict.predict_lines([monaformula.parse_file(filename) for filename in files])
+
+
+def check_sizes(files, monabin):
+    """
+    All paths have to give the same prediction.
+    """
+    for filename, batch in zip(files, predict_batch(files)):
+        if batch != predict_native(filename):
+            print("Mismatch: {0} native {1}, batch {2}".format(os.path.basename(filename), \
+                predict_native(filename), batch))
+    for filename in files:
+        try:
+            native, mona = predict_native(filename), predict_mona(filename, monabin)
+        except subprocess.CalledProcessError as _:
+            print("MONA failed: {0}".format(os.path.basename(filename)))
+            continue
+        if native != mona:
+            print("Mismatch: {0} native {1}, mona {2}".format(os.path.basename(filename), \
+                native, mona))
+
+
+def print_speed(name, files, fun):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for filename in files:
+            fun(filename)
+    elapsed = time.perf_counter() - start
+    print("{0: <9} {1:.1f} predictions/s".format(name + ":", len(files)*REPEAT/elapsed))
+
+
+def print_batch_speed(name, files):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        predict_batch(files)
+    elapsed = time.perf_counter() - start
+    print("{0: <9} {1:.1f} predictions/s".format(name + ":", len(files)*REPEAT/elapsed))
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./bench-predict.py [mona-bin] [formula folder] [--repeat=X]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+ Columnar files of construction records written by mona-stat.py and read by
+ process-results.py.
+ @title columns.py
+"""
+
+import numpy
+
+#Columns of a construction record
+HEADER = ["operation", "operand1", "size1", "fv1", "operand2", "size2", "fv2",
+          "result", "resultsize", "fvr", "minresult", "minsize", "fvm"]
+#Integer columns: ids of automata and sizes (the other columns are strings)
+IDS = ["operand1", "operand2", "result", "minresult"]
+SIZES = ["size1", "size2", "resultsize", "minsize"]
+NUMBERS = IDS + SIZES
+STRINGS = [column for column in HEADER if column not in NUMBERS]
+
+#Id of a missing automaton (0x0 in the trace)
+NONE = -1
+EXTENSION = ".npz"
+
+
+def encode_strings(strings):
+    """
+    Get strings as a single UTF-8 buffer and the offsets of the strings in it
+    (the string i is buffer[offsets[i]:offsets[i + 1]]).
+    """
+    encoded = [string.encode() for string in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8), offsets
+
+
+def dictionary(values):
+    """
+    Dictionary-encode values: get the indices of the values in the table of
+    distinct values (in the order of their first occurrence) and the table.
+    """
+    index = dict()
+    codes = numpy.fromiter((index.setdefault(value, len(index)) for value in values), \
+        dtype=numpy.int32, count=len(values))
+    return codes, list(index)
+
+
+def automaton_id(id):
+    #Ids of automata in the trace are hexadecimal, with or without 0x
+    if id == "0x0":
+        return NONE
+    return int(id, 16)
+
+
+def write_records(filename, records, names):
+    """
+    Write construction records (rows of HEADER given as strings) and the
+    names of automata by their ids to an uncompressed npz file of a few
+    arrays: ids and sizes as rows of an int64 matrix, operations and free
+    variables dictionary-encoded as rows of an int32 matrix of codes, and all
+    tables of strings (with the names last) in a single buffer.
+    """
+    numbers = numpy.empty((len(NUMBERS), len(records)), dtype=numpy.int64)
+    codes = numpy.empty((len(STRINGS), len(records)), dtype=numpy.int32)
+    strings = list()
+    counts = list()
+    for row, column in enumerate(NUMBERS):
+        i = HEADER.index(column)
+        if column in IDS:
+            numbers[row] = [automaton_id(record[i]) for record in records]
+        else:
+            numbers[row] = [int(record[i]) for record in records]
+    for row, column in enumerate(STRINGS):
+        i = HEADER.index(column)
+        codes[row], table = dictionary([record[i] for record in records])
+        strings += table
+        counts.append(len(table))
+    strings += list(names.values())
+    counts.append(len(names))
+    buffer, offsets = encode_strings(strings)
+    numpy.savez(filename, numbers=numbers, codes=codes, strings=buffer, offsets=offsets, \
+        counts=numpy.array(counts, dtype=numpy.int64), \
+        names=numpy.array([automaton_id(id) for id in names], dtype=numpy.int64))
+
+
+class Records:
+    """
+    Columns of a file written by write_records. Integer columns are rows of
+    the matrix stored in the file; a string column is a row of codes into
+    its table of strings, decoded when it is first needed.
+    """
+
+    __slots__ = ("numbers", "codes", "buffer", "offsets", "starts", "ids", "tables")
+
+    def __init__(self, filename):
+        with numpy.load(filename) as data:
+            self.numbers = data["numbers"]
+            self.codes = data["codes"]
+            self.buffer = data["strings"].tobytes()
+            self.offsets = data["offsets"]
+            self.starts = numpy.concatenate([[0], numpy.cumsum(data["counts"])]).tolist()
+            self.ids = data["names"]
+        self.tables = dict()
+
+
+    def __len__(self):
+        return self.numbers.shape[1]
+
+
+    def column(self, column):
+        if column in NUMBERS:
+            return self.numbers[NUMBERS.index(column)]
+        return self.codes[STRINGS.index(column)]
+
+
+    def table(self, column):
+        """
+        Get the table of strings of a string column (or of the names).
+        """
+        if column not in self.tables:
+            row = len(STRINGS) if column == "names" else STRINGS.index(column)
+            offsets = self.offsets[self.starts[row]:self.starts[row + 1] + 1].tolist()
+            self.tables[column] = [self.buffer[offsets[i]:offsets[i + 1]].decode() \
+                for i in range(len(offsets) - 1)]
+        return self.tables[column]
+
+
+    def names(self):
+        return dict(zip(self.ids.tolist(), self.table("names")))
@@ -0,0 +1,140 @@
+"""
+ Progress events of benchmark runs written as JSON lines to a file or a TCP
+ socket (see live-view.py).
+ @title events.py
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import contextlib
+
+#Target of the events: a file or tcp:HOST:PORT (None if the events are off)
+TARGET = None
+#Task names are cut to this length
+NAME_LENGTH = 200
+
+#Outcomes of tasks and tools (a memory limit exceeded is runner.MEMOUT)
+OK = "OK"
+TIMEOUT = "TO"
+ERROR = "ERROR"
+SKIPPED = "skipped"
+
+#Writers of the target by process (forked workers open their own)
+WRITERS = dict()
+#Tasks running in this process, innermost last
+RUNNING = list()
+
+
+class Task:
+    """
+    Task of a run: its outcome is the first outcome of its tools other than
+    OK (ERROR if there is none and the task raises), its rss the peak rss of
+    its tools.
+    """
+
+    __slots__ = ("name", "start", "outcome", "rss")
+
+    def __init__(self, name):
+        self.name = name[:NAME_LENGTH]
+        self.start = time.monotonic()
+        self.outcome = OK
+        self.rss = None
+
+
+def set_target(target):
+    global TARGET
+    TARGET = target
+    WRITERS.clear()
+
+
+def open_target(target):
+    if target.startswith("tcp:"):
+        host, port = target[4:].rsplit(":", 1)
+        return socket.create_connection((host, int(port))).sendall
+    #Lines appended by a single write do not interleave between processes
+    fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    return lambda line: os.write(fd, line)
+
+
+def emit(event, **fields):
+    if TARGET is None:
+        return
+    fields["event"] = event
+    fields["time"] = round(time.time(), 3)
+    fields["pid"] = os.getpid()
+    try:
+        if fields["pid"] not in WRITERS:
+            WRITERS.clear()
+            WRITERS[fields["pid"]] = open_target(TARGET)
+        WRITERS[fields["pid"]]((json.dumps(fields) + "\n").encode())
+    except OSError as err:
+        sys.stderr.write("Warning: events to {0} are off: {1}\n".format(TARGET, err))
+        set_target(None)
+
+
+def sweep(total):
+    emit("sweep", total=total, argv=sys.argv)
+
+
+def finish():
+    emit("finish")
+
+
+def describe(fun, args):
+    return "{0}({1})".format(fun.__name__, ", ".join(str(arg) for arg in args))
+
+
+@contextlib.contextmanager
+def task(name):
+    """
+    Emit the start and the end (with the duration, rss and outcome) of a
+    task around the block.
+    """
+    current = Task(name)
+    emit("start", task=current.name)
+    RUNNING.append(current)
+    try:
+        yield current
+    except Exception:
+        if current.outcome == OK:
+            current.outcome = ERROR
+        raise
+    finally:
+        RUNNING.pop()
+        emit("end", task=current.name, duration=round(time.monotonic() - current.start, 3), \
+            rss=current.rss, outcome=current.outcome)
+
+
+@contextlib.contextmanager
+def tracking():
+    """
+    Track the outcome and rss of the tools run in the block (as a task that
+    emits no events).
+    """
+    current = Task("")
+    RUNNING.append(current)
+    try:
+        yield current
+    finally:
+        RUNNING.remove(current)
+
+
+def skipped(name):
+    #A task that is not run ends without starting
+    emit("end", task=name[:NAME_LENGTH], duration=0, rss=None, outcome=SKIPPED)
+
+
+def tool(argv, outcome, usage):
+    """
+    Record a finished tool (see runner.get_usage for the usage) in the
+    running tasks.
+    """
+    for current in RUNNING:
+        current.rss = usage["rss"] if current.rss is None else max(current.rss, usage["rss"])
+        if current.outcome == OK:
+            current.outcome = outcome
+    emit("tool", task=RUNNING[-1].name if RUNNING else None, argv=[str(arg) for arg in argv], \
+        outcome=outcome, wall=round(usage["wall"], 3), rss=usage["rss"])
@@ -14,14 +14,19 @@ import re
 import os
 import os.path
 import resource
+import shlex
+
+import monatrace
+import runner
+import resultcache
+import events
 
 VALIDLINE = -2
 TIMELINE = -1
 TIMEOUT = 100 #in seconds
 FORMULAS = 20
-
-PREPROFILE = "test-wgjcm3.mona"
-ANTIPREFILE = "test-wgjcm4.mona"
+#Times of failed runs (None for timeouts and errors of MONA)
+FAILURES = (None, runner.MEMOUT, runner.PRENEX_TIMEOUT, runner.PRENEX_MEMOUT)
 
 def main():
     if len(sys.argv) < 4:
@@ -33,19 +38,36 @@ def main():
     formulafolder = sys.argv[3]
 
     try:
-        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas="])
+        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas=", "cache=", \
+            "memlimit=", "cpulimit=", "events=", "lazy-worker=", "mona-worker="])
     except getopt.GetoptError as err:
         help_err()
         sys.exit()
 
     texout = False
     FORMULAS = 20
+    cache = None
+    memlimit = None
+    cpulimit = None
 
     for o, a in opts:
         if o in ("-t", "--tex"):
             texout = True
         if o in ("-f", "--formulas"):
             FORMULAS = int(a)
+        if o == "--cache":
+            cache = resultcache.ResultCache(a)
+        if o == "--memlimit":
+            memlimit = int(a)
+        if o == "--cpulimit":
+            cpulimit = int(a)
+        if o == "--events":
+            events.set_target(a)
+        if o == "--lazy-worker":
+            runner.set_worker(lazybin, shlex.split(a))
+        if o == "--mona-worker":
+            runner.set_worker(monabin, shlex.split(a))
+    runner.set_limits(memlimit, cpulimit)
 
     files = [f for f in os.listdir(formulafolder) \
         if os.path.isfile(os.path.join(formulafolder, f)) and \
@@ -60,26 +82,26 @@ def main():
     tex += "\\textbf{Formula File} & \\textbf{Mona} & \\textbf{Mona+antiprenex} & \\textbf{Mona+antiprenex+pred} \\\\\n\\toprule \n"
 
 
+    events.sweep(len(files))
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
 
-        try:
-            anti_time = prenex_file(PREPROFILE, [lazybin, filename, "-w"])
-            mona_output = subprocess.check_output([monabin, PREPROFILE], timeout=TIMEOUT).decode("utf-8")
-            mona_parse = parse_mona(mona_output)
-            os.remove(PREPROFILE)
-        except subprocess.TimeoutExpired:
-            mona_parse = None, None
-        except subprocess.CalledProcessError as e:
-            mona_parse = None, None
-
-        mona_parse_anti = run_mona(ANTIPREFILE, monabin, [lazybin, filename])
-        mona_parse_anti_pred = run_mona(ANTIPREFILE, monabin, [lazybin, filename, "-p"])
+        with events.task(filename):
+            params = [lazybin, filename, "-w"]
+            mona_parse = resultcache.cached_call(cache, params + [monabin], TIMEOUT, \
+                run_mona_prenex, monabin, params)
+            params = [lazybin, filename]
+            mona_parse_anti = resultcache.cached_call(cache, params + [monabin], TIMEOUT, \
+                run_mona, monabin, params)
+            params = [lazybin, filename, "-p"]
+            mona_parse_anti_pred = resultcache.cached_call(cache, params + [monabin], TIMEOUT, \
+                run_mona, monabin, params)
 
         filename = os.path.basename(filename)
         print_output(filename, mona_parse, mona_parse_anti, mona_parse_anti_pred)
 
-        if mona_parse[1] is None or mona_parse_anti[1] is None or mona_parse_anti_pred[1] is None:
+        if any(parse[1] in FAILURES for parse in [mona_parse, mona_parse_anti, \
+                mona_parse_anti_pred]):
             blazy = bmp = bmpp = False
         else:
             blazy = True if mona_parse[1] < mona_parse_anti[1] and mona_parse[1] < mona_parse_anti_pred[1] else False
@@ -88,37 +110,60 @@ def main():
         tex = tex + "\\emph{{{0}}} & {1} & {2} & {3} \\\\\n".format(filename, \
             format_output(mona_parse, blazy), format_output_anti(mona_parse_anti, bmp), \
             format_output_anti(mona_parse_anti_pred, bmpp))
+    events.finish()
+
+    resultcache.print_stats(cache)
+    print("Workers: {0}".format(runner.format_workers()))
 
     tex += "\\end{tabular}\n\\end{table}"
     if texout:
         print(tex)
 
 
-def run_mona(store, monabin, params):
+def run_mona_prenex(monabin, params):
+    try:
+        f, anti_time = prenex_file(params)
+        with f:
+            mona_output, usage = runner.run_tool([monabin, f.name], TIMEOUT)
+        mona_parse = parse_mona(mona_output.decode("utf-8")) + (usage,)
+    except runner.PrenexExpired as e:
+        mona_parse = None, e.outcome, e.usage
+    except subprocess.TimeoutExpired as e:
+        mona_parse = None, None, e.usage
+    except runner.MemoryExpired as e:
+        mona_parse = None, runner.MEMOUT, e.usage
+    except subprocess.CalledProcessError as e:
+        mona_parse = None, None, e.usage
+    return mona_parse
+
+
+def run_mona(monabin, params):
     try:
-        anti_time = prenex_file(store, params)
-        mona_output_anti = subprocess.check_output([monabin, store], timeout=TIMEOUT).decode("utf-8")
-        mona_parse_anti = parse_mona(mona_output_anti)
-        os.remove(store)
-    except subprocess.TimeoutExpired:
-        mona_parse_anti = None, None, None
+        f, anti_time = prenex_file(params)
+        with f:
+            mona_output_anti, usage = runner.run_tool([monabin, f.name], TIMEOUT)
+        mona_parse_anti = parse_mona(mona_output_anti.decode("utf-8")) + (usage,)
+    except runner.PrenexExpired as e:
+        mona_parse_anti = None, e.outcome, None, e.usage
+    except subprocess.TimeoutExpired as e:
+        mona_parse_anti = None, None, None, e.usage
+    except runner.MemoryExpired as e:
+        mona_parse_anti = None, runner.MEMOUT, None, e.usage
     except subprocess.CalledProcessError as e:
-        mona_parse_anti = None, None, None
+        mona_parse_anti = None, None, None, e.usage
 
-    if mona_parse_anti[1] is None:
-        mona_parse_anti = mona_parse_anti[0], None, None
+    if mona_parse_anti[1] in FAILURES:
+        mona_parse_anti = mona_parse_anti[0], mona_parse_anti[1], None, mona_parse_anti[-1]
     else:
-        mona_parse_anti = mona_parse_anti[0], round(mona_parse_anti[1], 2), round(anti_time, 2)
+        mona_parse_anti = mona_parse_anti[0], round(mona_parse_anti[1], 2), round(anti_time, 2), \
+            mona_parse_anti[-1]
     return mona_parse_anti
 
 
-def prenex_file(store, input):
-    f = open(store, "w")
-    output_anti = subprocess.check_output(input, timeout=TIMEOUT).decode("utf-8")
-    anti_fle, anti_time = parse_prenex(output_anti)
-    f.write(anti_fle)
-    f.close()
-    return anti_time
+def prenex_file(input):
+    output_anti, _ = runner.run_prenex(input, TIMEOUT)
+    anti_fle, anti_time = parse_prenex(output_anti.decode("utf-8"))
+    return runner.formula_file(anti_fle), anti_time
 
 
 def parse_prenex(output):
@@ -134,50 +179,47 @@ def parse_mona(output):
     valid = None
     time = None
     for line in output.split('\n'):
-        out = parse_mona_sat(line)
-        if out is not None:
-            valid = out
-        out = parse_mona_time(line)
-        if out is not None:
-            time = out
+        kind, match = monatrace.classify_result(line)
+        if kind in RESULTS:
+            valid, time = RESULTS[kind](match, valid, time)
     return valid, time
 
 
-def parse_mona_sat(line):
-    match = re.search("Formula is unsatisfiable", line)
-    if match is not None:
-        return False
-    match = re.search("A satisfying example", line)
-    if match is not None:
-        return True
-    return None
+def parse_mona_sat(match, valid, time):
+    return match.lastgroup == monatrace.SAT, time
+
+
+def parse_mona_time(match, valid, time):
+    return valid, monatrace.parse_time(match)
 
 
-def parse_mona_time(line):
-    match = re.search("Time: ([0-9][0-9]):([0-9][0-9]):([0-9][0-9].[0-9][0-9])", line)
-    if match is not None:
-        time = 3600*float(match.group(1)) + 60*float(match.group(2)) + float(match.group(3))
-        return time
-    return None
+RESULTS = {
+    monatrace.UNSAT: parse_mona_sat,
+    monatrace.SAT: parse_mona_sat,
+    monatrace.TIME: parse_mona_time,
+}
 
 
 def print_config():
     print("Timeout: {0}".format(TIMEOUT))
+    print("Limits: {0}".format(runner.format_limits()))
     print("Number of formulas: {0}".format(FORMULAS))
 
 
 def format_output(parse, bold):
     if bold:
-        return "\\textbf{{{0}}}".format("TO" if parse[1] is None else parse[1])
+        return "\\textbf{{{0}}} [{1}]".format("TO" if parse[1] is None else parse[1], runner.format_usage(parse[-1]))
     else:
-        return "{0}".format("TO" if parse[1] is None else parse[1])
+        return "{0} [{1}]".format("TO" if parse[1] is None else parse[1], runner.format_usage(parse[-1]))
 
 
 def format_output_anti(parse, bold):
     if bold:
-        return "\\textbf{{{0}}}({1})".format("TO" if parse[1] is None else parse[1], "TO" if parse[2] is None else parse[2])
+        return "\\textbf{{{0}}}({1}) [{2}]".format("TO" if parse[1] is None else parse[1], \
+            "TO" if parse[2] is None else parse[2], runner.format_usage(parse[-1]))
     else:
-        return "{0}({1})".format("TO" if parse[1] is None else parse[1], "TO" if parse[2] is None else parse[2])
+        return "{0}({1}) [{2}]".format("TO" if parse[1] is None else parse[1], \
+            "TO" if parse[2] is None else parse[2], runner.format_usage(parse[-1]))
 
 
 def print_output(filename, lazy_parse, mona_parse, mona_parse_pred):
@@ -186,7 +228,9 @@ def print_output(filename, lazy_parse, mona_parse, mona_parse_pred):
 
 
 def help_err():
-    sys.stderr.write("Bad input arguments. \nFormat: ./experimental-prenex [lazy-bin]  [mona-bin] [formula folder]\n")
+    sys.stderr.write("Bad input arguments. \nFormat: ./experimental-prenex [lazy-bin]  [mona-bin] [formula folder]"\
+        " [--tex] [--formulas=X] [--cache=DIR] [--memlimit=MB] [--cpulimit=S]"\
+        " [--events=FILE|tcp:HOST:PORT] [--lazy-worker=CMD] [--mona-worker=CMD]\n")
 
 
 if __name__ == "__main__":
@@ -14,6 +14,11 @@ import re
 import os
 import os.path
 import resource
+import shlex
+
+import runner
+import resultcache
+import events
 
 VALIDLINE = -3
 SPACELINE = -2
@@ -26,7 +31,8 @@ def main():
         help_err()
         sys.exit()
     try:
-        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas="])
+        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas=", "cache=", \
+            "memlimit=", "cpulimit=", "events=", "lazy-worker=", "mona-worker="])
     except getopt.GetoptError as err:
         help_err()
         sys.exit()
@@ -36,12 +42,28 @@ def main():
     formulafolder = sys.argv[3]
     texout = False
     FORMULAS = 5
+    cache = None
+    memlimit = None
+    cpulimit = None
 
     for o, a in opts:
         if o in ("-t", "--tex"):
             texout = True
         if o in ("-f", "--formulas"):
             FORMULAS = int(a)
+        if o == "--cache":
+            cache = resultcache.ResultCache(a)
+        if o == "--memlimit":
+            memlimit = int(a)
+        if o == "--cpulimit":
+            cpulimit = int(a)
+        if o == "--events":
+            events.set_target(a)
+        if o == "--lazy-worker":
+            runner.set_worker(lazybin, shlex.split(a))
+        if o == "--mona-worker":
+            runner.set_worker(monabin, shlex.split(a))
+    runner.set_limits(memlimit, cpulimit)
 
     #Experiments
 
@@ -57,45 +79,74 @@ def main():
     print_config(FORMULAS)
     print("Formula: lazy approach, MONA, MONA+antiprenex")
 
+    events.sweep(len(files))
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
 
-        try:
-            lazy_output = subprocess.check_output([lazybin, filename], \
-                timeout=TIMEOUT).decode("utf-8")
-            lazy_parse = parse_lazy(lazy_output)
-        except subprocess.TimeoutExpired:
-            lazy_parse = None, None
-        try:
-            mona_output = subprocess.check_output([monabin, "-s", filename], \
-                timeout=TIMEOUT).decode("utf-8")
-            mona_parse = parse_mona(mona_output)
-        except subprocess.TimeoutExpired:
-            mona_parse = None, None
-        except subprocess.CalledProcessError as e:
-            mona_parse = None, None
-        try:
-            f = open("test.mona", "w")
-            subprocess.call([lazybin, filename, "--prenex"], timeout=TIMEOUT, stdout=f)
-            mona_pren_output = subprocess.check_output([monabin, "-s", "test.mona"], \
-                timeout=TIMEOUT).decode("utf-8")
-            mona_pren_parse = parse_mona(mona_pren_output)
-            f.close()
-        except subprocess.TimeoutExpired:
-            mona_pren_parse = None, None
-        except subprocess.CalledProcessError as e:
-            mona_pren_parse = None, None
+        with events.task(filename):
+            lazy_parse = resultcache.cached_call(cache, [lazybin, filename], TIMEOUT, \
+                run_lazy, lazybin, filename)
+            mona_parse = resultcache.cached_call(cache, [monabin, "-s", filename], TIMEOUT, \
+                run_mona, monabin, filename)
+            mona_pren_parse = resultcache.cached_call(cache, [lazybin, filename, "--prenex", monabin, "-s"], \
+                TIMEOUT, run_mona_prenex, lazybin, monabin, filename)
 
         print_output(filename, lazy_parse, mona_parse, mona_pren_parse)
         tex = tex + "\\emph{{{0}}} & {1} & {2} & {3} \\\\\n\\midrule\n".format(filename, \
             format_output(lazy_parse), format_output(mona_parse), \
             format_output(mona_pren_parse))
+    events.finish()
+
+    resultcache.print_stats(cache)
+    print("Workers: {0}".format(runner.format_workers()))
 
     tex += "\\end{tabular}\n\\end{table}"
     if texout:
         print(tex)
 
 
+def run_lazy(lazybin, filename):
+    try:
+        lazy_output, usage = runner.run_tool([lazybin, filename], TIMEOUT)
+        lazy_parse = parse_lazy(lazy_output.decode("utf-8")) + (usage,)
+    except subprocess.TimeoutExpired as e:
+        lazy_parse = None, None, e.usage
+    except runner.MemoryExpired as e:
+        lazy_parse = None, runner.MEMOUT, e.usage
+    return lazy_parse
+
+
+def run_mona(monabin, filename):
+    try:
+        mona_output, usage = runner.run_tool([monabin, "-s", filename], TIMEOUT)
+        mona_parse = parse_mona(mona_output.decode("utf-8")) + (usage,)
+    except subprocess.TimeoutExpired as e:
+        mona_parse = None, None, e.usage
+    except runner.MemoryExpired as e:
+        mona_parse = None, runner.MEMOUT, e.usage
+    except subprocess.CalledProcessError as e:
+        mona_parse = None, None, e.usage
+    return mona_parse
+
+
+def run_mona_prenex(lazybin, monabin, filename):
+    #The usage is the one of MONA, the prenexing is measured only if it fails
+    try:
+        with runner.formula_file() as f:
+            runner.run_prenex([lazybin, filename, "--prenex"], TIMEOUT, stdout=f)
+            mona_pren_output, usage = runner.run_tool([monabin, "-s", f.name], TIMEOUT)
+        mona_pren_parse = parse_mona(mona_pren_output.decode("utf-8")) + (usage,)
+    except runner.PrenexExpired as e:
+        mona_pren_parse = None, e.outcome, e.usage
+    except subprocess.TimeoutExpired as e:
+        mona_pren_parse = None, None, e.usage
+    except runner.MemoryExpired as e:
+        mona_pren_parse = None, runner.MEMOUT, e.usage
+    except subprocess.CalledProcessError as e:
+        mona_pren_parse = None, None, e.usage
+    return mona_pren_parse
+
+
 def parse_lazy(output):
     lines = output.split('\n')
     lines = list(filter(None, lines)) #Remove empty lines
@@ -138,11 +189,13 @@ def parse_mona_space(line):
 
 def print_config(formulas):
     print("Timeout: {0}".format(TIMEOUT))
+    print("Limits: {0}".format(runner.format_limits()))
     print("Number of formulas: {0}".format(formulas))
 
 
 def format_output(parse):
-    return "{0} {1}".format("N/A" if parse[0] is None else parse[0], "TO" if parse[1] is None else parse[1])
+    return "{0} {1} ({2})".format("N/A" if parse[0] is None else parse[0], "TO" if parse[1] is None else parse[1], \
+        runner.format_usage(parse[2]))
 
 
 def print_output(filename, lazy_parse, mona_parse, mona_pren_parse):
@@ -152,7 +205,9 @@ def print_output(filename, lazy_parse, mona_parse, mona_pren_parse):
 
 def help_err():
     sys.stderr.write("Bad input arguments. \nFormat: ./experimental [lazy-bin]"\
-        " [mona-bin] [formula folder] [--tex] [--formulas=X]\n")
+        " [mona-bin] [formula folder] [--tex] [--formulas=X] [--cache=DIR]"\
+        " [--memlimit=MB] [--cpulimit=S] [--events=FILE|tcp:HOST:PORT]"\
+        " [--lazy-worker=CMD] [--mona-worker=CMD]\n")
 
 
 if __name__ == "__main__":
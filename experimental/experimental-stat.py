@@ -15,14 +15,16 @@ import os
 import os.path
 import resource
 
+import monatrace
+import freevars
+import runner
+import events
+
 VALIDLINE = -2
 TIMELINE = -1
 TIMEOUT = 300 #in seconds
 FORMULAS = 20
 
-PREPROFILE = "test-wgjcm3.mona"
-ANTIPREFILE = "test-wgjcm4.mona"
-
 def main():
     if len(sys.argv) < 4:
         help_err()
@@ -33,19 +35,29 @@ def main():
     formulafolder = sys.argv[3]
 
     try:
-        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas="])
+        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas=", "events=", \
+            "memlimit=", "cpulimit="])
     except getopt.GetoptError as err:
         help_err()
         sys.exit()
 
     texout = False
     FORMULAS = 20
+    memlimit = None
+    cpulimit = None
 
     for o, a in opts:
         if o in ("-t", "--tex"):
             texout = True
         if o in ("-f", "--formulas"):
             FORMULAS = int(a)
+        if o == "--events":
+            events.set_target(a)
+        if o == "--memlimit":
+            memlimit = int(a)
+        if o == "--cpulimit":
+            cpulimit = int(a)
+    runner.set_limits(memlimit, cpulimit)
 
     files = [f for f in os.listdir(formulafolder) \
         if os.path.isfile(os.path.join(formulafolder, f)) and \
@@ -56,48 +68,46 @@ def main():
     print_config()
     print("Formula: MONA, MONA+antiprenex")
 
+    events.sweep(len(files))
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
 
-        try:
-            anti_time = prenex_file(PREPROFILE, [lazybin, filename, "-w"])
-            mona_output = subprocess.check_output([monabin, "-i", PREPROFILE], timeout=TIMEOUT).decode("utf-8")
-            mona_parse = parse_mona(mona_output)
-            os.remove(PREPROFILE)
-        except subprocess.TimeoutExpired:
-            mona_parse = "TO"
-        except subprocess.CalledProcessError as e:
-            mona_parse = "None"
-
-        mona_parse_anti = run_mona(ANTIPREFILE, monabin, [lazybin, filename])
-        mona_parse_anti_pred = run_mona(ANTIPREFILE, monabin, [lazybin, filename, "-p"])
+        #The outcome of the task is the first failure of its tools
+        with events.task(filename):
+            mona_parse = run_mona(monabin, [lazybin, filename, "-w"])
+            mona_parse_anti = run_mona(monabin, [lazybin, filename])
+            mona_parse_anti_pred = run_mona(monabin, [lazybin, filename, "-p"])
 
         print_output(filename, "", mona_parse)
         print_output(filename, "-a", mona_parse_anti)
         print_output(filename, "-ap", mona_parse_anti_pred)
+    events.finish()
 
 
 
-def run_mona(store, monabin, params):
+def run_mona(monabin, params):
+    #A failed run gives its outcome instead of the statistics
     try:
-        anti_time = prenex_file(store, params)
-        mona_output_anti = subprocess.check_output([monabin, "-i", store], timeout=TIMEOUT).decode("utf-8")
-        mona_parse_anti = parse_mona(mona_output_anti)
-        os.remove(store)
+        f, anti_time = prenex_file(params)
+        with f:
+            mona_output_anti, _ = runner.run_tool([monabin, "-i", f.name], TIMEOUT)
+        mona_parse_anti = parse_mona(mona_output_anti.decode("utf-8"))
+    except runner.PrenexExpired as e:
+        mona_parse_anti = e.outcome
     except subprocess.TimeoutExpired:
-        mona_parse_anti = "TO"
-    except subprocess.CalledProcessError as e:
-        mona_parse_anti = "None"
+        mona_parse_anti = events.TIMEOUT
+    except runner.MemoryExpired:
+        mona_parse_anti = runner.MEMOUT
+    except subprocess.CalledProcessError:
+        mona_parse_anti = events.ERROR
     return mona_parse_anti
 
 
-def prenex_file(store, input):
-    f = open(store, "w")
-    output_anti = subprocess.check_output(input, timeout=TIMEOUT).decode("utf-8")
+def prenex_file(input):
+    output_anti, _ = runner.run_prenex(input, TIMEOUT)
+    output_anti = output_anti.decode("utf-8")
     anti_fle, anti_time = parse_prenex(output_anti)
-    f.write(anti_fle)
-    f.close()
-    return anti_time
+    return runner.formula_file(anti_fle), anti_time
 
 
 def parse_prenex(output):
@@ -117,99 +127,91 @@ def format_op(op, params):
 
 
 def parse_mona(output):
-    res = ""
+    res = list()
+    table = freevars.VarTable()
     lines = output.split('\n')
     for i in range(len(lines)):
-        line = lines[i]
-        if line.startswith("Product &"):
-            parse = proc_product(lines, i)
-            res = res + "{0}\n".format(format_op("&", parse))
-        if line.startswith("Product |"):
-            parse = proc_product(lines, i)
-            res = res + "{0}\n".format(format_op("|", parse))
-        if line.startswith("Projecting"):
-            parse = parse_mona_projection(lines[i+3:i+5])
-            fv = dfa_fv(lines[i+6:])
-            parse.append(','.join(fv))
-            res = res + "{0}\n".format(format_op("proj", parse))
-    return res
+        kind, match = monatrace.classify(lines[i])
+        if kind in PARSERS:
+            parse = PARSERS[kind](lines, i, match, table)
+            if parse is not None:
+                res.append("{0}\n".format(parse))
+    return "".join(res)
 
 
-def proc_product(lines, i):
+def proc_product(lines, i, match, table):
+    if match.group("op") not in ["&", "|"]:
+        return None
     parse = parse_mona_product(lines[i+3:i+5])
     j = i+6
     if parse is None:
         parse = parse_mona_product(lines[i+1:i+3])
         j = i+4
-    fv = dfa_fv(lines[j:])
+    fv = dfa_fv(lines, j, table)
+    parse.append(','.join(fv))
+    return format_op(match.group("op"), parse)
+
+
+def proc_projection(lines, i, match, table):
+    parse = parse_mona_projection(lines[i+3:i+5])
+    fv = dfa_fv(lines, i+6, table)
     parse.append(','.join(fv))
-    return parse
+    return format_op("proj", parse)
+
+
+PARSERS = {
+    monatrace.PRODUCT: proc_product,
+    monatrace.PROJECT: proc_projection,
+}
 
 
 def parse_mona_sat(line):
-    match = re.search("Formula is unsatisfiable", line)
-    if match is not None:
+    kind, _ = monatrace.classify_result(line)
+    if kind == monatrace.UNSAT:
         return False
-    match = re.search("A satisfying example", line)
-    if match is not None:
+    if kind == monatrace.SAT:
         return True
     return None
 
 
 def parse_mona_product(lines):
     res = [None]*4
-    match = re.search("\\(([0-9]+),[0-9]+\\)x\\(([0-9]+),[0-9]+\\) -> \\(([0-9]+),[0-9]+\\)", lines[0])
+    match = monatrace.PRODUCT_LINE.search(lines[0])
     if match is None:
         return None
-    res[0], res[1], res[2] = int(match.group(1)), int(match.group(2)), int(match.group(3))
-    match = re.search("Minimizing \\([0-9]+,[0-9]+\\) -> \\(([0-9]+),[0-9]+\\)", lines[1])
+    res[0], res[1], res[2] = int(match.group(1)), int(match.group(3)), int(match.group(5))
+    match = monatrace.MINIMIZE_LINE.search(lines[1])
     if match is None:
         return None
-    res[3] = int(match.group(1))
+    res[3] = int(match.group(3))
     return res
 
 
 def parse_mona_projection(lines):
     res = [None]*4
-    match = re.search("\\(([0-9]+),[0-9]+\\) -> \\(([0-9]+),[0-9]+\\)", lines[0])
-    res[0], res[1], res[2] = int(match.group(1)), -1, int(match.group(2))
-    match = re.search("Minimizing \\([0-9]+,[0-9]+\\) -> \\(([0-9]+),[0-9]+\\)", lines[1])
-    res[3] = int(match.group(1))
+    match = monatrace.PROJECT_LINE.search(lines[0])
+    res[0], res[1], res[2] = int(match.group(1)), -1, int(match.group(3))
+    match = monatrace.MINIMIZE_LINE.search(lines[1])
+    res[3] = int(match.group(3))
     return res
 
 
-def dfa_fv(lines):
-    fv = set()
-    for line in lines[5:]:
-        ret = parse_dfa_trans(line)
-        if ret is None:
+def dfa_fv(lines, start, table):
+    """
+    Get the free variables of the DFA printed from lines[start].
+    """
+    fv = 0
+    for i in range(start + 5, len(lines)):
+        kind, match = monatrace.classify(lines[i])
+        if kind != monatrace.DFA_TRANS:
             break
-        _, sym, _ = ret
-        fv = fv.union(symbols_free_vars(sym))
-    return fv
-
-
-def parse_dfa_trans(line):
-    match = re.search("^State ([0-9]+): ([^->]*) -> state ([0-9]+)$", line)
-    if match is None:
-        return None
-    fr, label, to = int(match.group(1)), match.group(2), match.group(3)
-    if label.strip() == "":
-        syms = []
-    else:
-        syms = label.split(", ")
-    return fr, syms, to
-
-
-def symbols_free_vars(syms):
-    fv = set()
-    for sym in syms:
-        fv.add(sym.split("=")[0])
-    return fv
+        fv |= table.label_bits(monatrace.transition_text(kind, match))
+    return set(table.names(fv))
 
 
 def print_config():
     print("Timeout: {0}".format(TIMEOUT))
+    print("Limits: {0}".format(runner.format_limits()))
     print("Number of formulas: {0}".format(FORMULAS))
 
 
@@ -223,7 +225,8 @@ def print_output(filename, suf, output):
 
 
 def help_err():
-    sys.stderr.write("Bad input arguments. \nFormat: ./experimental-prenex [lazy-bin]  [mona-bin] [formula folder]\n")
+    sys.stderr.write("Bad input arguments. \nFormat: ./experimental-prenex [lazy-bin]  [mona-bin] [formula folder]"\
+        " [--tex] [--formulas=X] [--events=FILE|tcp:HOST:PORT] [--memlimit=MB] [--cpulimit=S]\n")
 
 
 if __name__ == "__main__":
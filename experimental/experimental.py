@@ -14,6 +14,12 @@ import re
 import os
 import os.path
 import resource
+import shlex
+
+import runner
+import resultcache
+import events
+import schedule
 
 VALIDLINE = -3
 TIMELINE = -1
@@ -26,7 +32,8 @@ def main():
         help_err()
         sys.exit()
     try:
-        opts, args = getopt.getopt(sys.argv[4:], "tf:", ["tex", "formulas="])
+        opts, args = getopt.getopt(sys.argv[4:], "tf:j:c:", ["tex", "formulas=", "jobs=", "cpus=", \
+            "cache=", "memlimit=", "cpulimit=", "events=", "no-implied", "lazy-worker=", "mona-worker="])
     except getopt.GetoptError as err:
         help_err()
         sys.exit()
@@ -36,12 +43,37 @@ def main():
     formulafolder = sys.argv[3]
     texout = False
     FORMULAS = 5
+    jobs = 1
+    cpus = 1
+    cache = None
+    memlimit = None
+    cpulimit = None
+    imply = True
 
     for o, a in opts:
         if o in ("-t", "--tex"):
             texout = True
         if o in ("-f", "--formulas"):
             FORMULAS = int(a)
+        if o in ("-j", "--jobs"):
+            jobs = int(a)
+        if o in ("-c", "--cpus"):
+            cpus = int(a)
+        if o == "--cache":
+            cache = resultcache.ResultCache(a)
+        if o == "--memlimit":
+            memlimit = int(a)
+        if o == "--cpulimit":
+            cpulimit = int(a)
+        if o == "--events":
+            events.set_target(a)
+        if o == "--no-implied":
+            imply = False
+        if o == "--lazy-worker":
+            runner.set_worker(lazybin, shlex.split(a))
+        if o == "--mona-worker":
+            runner.set_worker(monabin, shlex.split(a))
+    runner.set_limits(memlimit, cpulimit)
 
     #Experiments
 
@@ -54,48 +86,96 @@ def main():
     tex += "\\begin{table}[h]\n\\begin{tabular}{llll}\n"
     tex += "\\textbf{Formula File} & \\textbf{Lazy Approach} & \\textbf{Mona} & \\textbf{Mona+antiprenex} \\\\\n\\toprule \n"
 
-    print_config(FORMULAS)
+    print_config(FORMULAS, jobs, imply)
     print("Formula: lazy approach, MONA, MONA+antiprenex")
 
+    tasks = list()
+    argvs = list()
+    keys = list()
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
-
-        try:
-            lazy_output = subprocess.check_output([lazybin, filename], \
-                timeout=TIMEOUT).decode("utf-8")
-            lazy_parse = parse_lazy(lazy_output)
-        except subprocess.TimeoutExpired:
-            lazy_parse = None, None
-        try:
-            mona_output = subprocess.check_output([monabin, filename], \
-                timeout=TIMEOUT).decode("utf-8")
-            mona_parse = parse_mona(mona_output)
-        except subprocess.TimeoutExpired:
-            mona_parse = None, None
-        except subprocess.CalledProcessError as e:
-            mona_parse = None, None
-        try:
-            f = open("test.mona", "w")
-            subprocess.call([lazybin, filename, "--prenex"], timeout=TIMEOUT, stdout=f)
-            mona_pren_output = subprocess.check_output([monabin, "test.mona"], \
-                timeout=TIMEOUT).decode("utf-8")
-            mona_pren_parse = parse_mona(mona_pren_output)
-            f.close()
-        except subprocess.TimeoutExpired:
-            mona_pren_parse = None, None
-        except subprocess.CalledProcessError as e:
-            mona_pren_parse = None, None
-
-        print_output(filename, lazy_parse, mona_parse, mona_pren_parse)
-        tex = tex + "\\emph{{{0}}} & {1} & {2} & {3} \\\\\n\\midrule\n".format(filename, \
-            format_output(lazy_parse), format_output(mona_parse), \
-            format_output(mona_pren_parse))
+        tasks.append((run_lazy, (lazybin, filename)))
+        argvs.append([lazybin, filename])
+        tasks.append((run_mona, (monabin, filename)))
+        argvs.append([monabin, filename])
+        tasks.append((run_mona_prenex, (lazybin, monabin, filename)))
+        argvs.append([lazybin, filename, "--prenex", monabin])
+        keys += [("lazy", filename), ("mona", filename), ("mona-prenex", filename)]
+
+    #Cheaper instances of series run first, a timeout of a tool implies
+    #the timeouts of the larger instances
+    scheduler = schedule.Scheduler(keys, timed_out, (None, schedule.IMPLIED, None), imply)
+
+    #Results of the tasks of a formula are printed once all the formulas
+    #before it are done, so the output stays sorted.
+    results = [None]*len(tasks)
+    printed = 0
+    for j, res in resultcache.run_tasks(cache, scheduler.tasks(tasks), scheduler.tasks(argvs), \
+            TIMEOUT, jobs, cpus, scheduler.skip):
+        results[scheduler.done(j, res)] = res
+        while printed < len(files) and None not in results[3*printed:3*printed+3]:
+            filename = os.path.join(formulafolder, files[printed])
+            lazy_parse, mona_parse, mona_pren_parse = results[3*printed:3*printed+3]
+            print_output(filename, lazy_parse, mona_parse, mona_pren_parse)
+            sys.stdout.flush()
+            tex = tex + "\\emph{{{0}}} & {1} & {2} & {3} \\\\\n\\midrule\n".format(filename, \
+                format_output(lazy_parse), format_output(mona_parse), \
+                format_output(mona_pren_parse))
+            printed += 1
+    resultcache.print_stats(cache)
+    if imply:
+        print("Implied timeouts: {0}".format(scheduler.skipped))
+    #Workers of the pool processes are not seen from here
+    if jobs <= 1:
+        print("Workers: {0}".format(runner.format_workers()))
 
     tex += "\\end{tabular}\n\\end{table}"
     if texout:
         print(tex)
 
 
+def run_lazy(lazybin, filename):
+    try:
+        lazy_output, usage = runner.run_tool([lazybin, filename], TIMEOUT)
+        lazy_parse = parse_lazy(lazy_output.decode("utf-8")) + (usage,)
+    except subprocess.TimeoutExpired as e:
+        lazy_parse = None, events.TIMEOUT, e.usage
+    except runner.MemoryExpired as e:
+        lazy_parse = None, runner.MEMOUT, e.usage
+    return lazy_parse
+
+
+def run_mona(monabin, filename):
+    try:
+        mona_output, usage = runner.run_tool([monabin, filename], TIMEOUT)
+        mona_parse = parse_mona(mona_output.decode("utf-8")) + (usage,)
+    except subprocess.TimeoutExpired as e:
+        mona_parse = None, events.TIMEOUT, e.usage
+    except runner.MemoryExpired as e:
+        mona_parse = None, runner.MEMOUT, e.usage
+    except subprocess.CalledProcessError as e:
+        mona_parse = None, events.ERROR, e.usage
+    return mona_parse
+
+
+def run_mona_prenex(lazybin, monabin, filename):
+    #The usage is the one of MONA, the prenexing is measured only if it fails
+    try:
+        with runner.formula_file() as f:
+            runner.run_prenex([lazybin, filename, "--prenex"], TIMEOUT, stdout=f)
+            mona_pren_output, usage = runner.run_tool([monabin, f.name], TIMEOUT)
+        mona_pren_parse = parse_mona(mona_pren_output.decode("utf-8")) + (usage,)
+    except runner.PrenexExpired as e:
+        mona_pren_parse = None, e.outcome, e.usage
+    except subprocess.TimeoutExpired as e:
+        mona_pren_parse = None, events.TIMEOUT, e.usage
+    except runner.MemoryExpired as e:
+        mona_pren_parse = None, runner.MEMOUT, e.usage
+    except subprocess.CalledProcessError as e:
+        mona_pren_parse = None, events.ERROR, e.usage
+    return mona_pren_parse
+
+
 def parse_lazy(output):
     lines = output.split('\n')
     lines = list(filter(None, lines)) #Remove empty lines
@@ -136,13 +216,22 @@ def parse_mona_time(line):
     return None
 
 
-def print_config(formulas):
+def timed_out(parse):
+    #Only timeouts imply timeouts, errors of tools do not
+    return parse[1] in (events.TIMEOUT, runner.PRENEX_TIMEOUT)
+
+
+def print_config(formulas, jobs, imply):
     print("Timeout: {0}".format(TIMEOUT))
+    print("Implied timeouts: {0}".format("on" if imply else "off"))
+    print("Limits: {0}".format(runner.format_limits()))
     print("Number of formulas: {0}".format(formulas))
+    print("Jobs: {0}".format(jobs))
 
 
 def format_output(parse):
-    return "{0} {1}".format("N/A" if parse[0] is None else parse[0], "TO" if parse[1] is None else parse[1])
+    return "{0} {1} ({2})".format("N/A" if parse[0] is None else parse[0], "TO" if parse[1] is None else parse[1], \
+        runner.format_usage(parse[2]))
 
 
 def print_output(filename, lazy_parse, mona_parse, mona_pren_parse):
@@ -152,7 +241,10 @@ def print_output(filename, lazy_parse, mona_parse, mona_pren_parse):
 
 def help_err():
     sys.stderr.write("Bad input arguments. \nFormat: ./experimental [lazy-bin]"\
-        " [mona-bin] [formula folder] [--tex] [--formulas=X]\n")
+        " [mona-bin] [formula folder] [--tex] [--formulas=X] [--jobs=X]"\
+        " [--cpus=X] [--cache=DIR] [--memlimit=MB] [--cpulimit=S]"\
+        " [--events=FILE|tcp:HOST:PORT] [--no-implied] [--lazy-worker=CMD]"\
+        " [--mona-worker=CMD]\n")
 
 
 if __name__ == "__main__":
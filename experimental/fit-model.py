@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""
+ Script fitting the size models of the predictor from the statistics
+ collected by process-results.py.
+ @title fit-model.py
+"""
+
+import sys
+import getopt
+import os
+import json
+
+import numpy
+
+#Operations of the predictor by the files of process-results.py
+BIN_OPERATIONS = {
+    "and.csv": "And",
+    "or.csv": "Or",
+    "impl.csv": "Impl",
+    "equiv.csv": "Biimpl",
+}
+UN_OPERATION = "proj.csv"
+
+#Columns of the files
+SIZE1 = 0
+SIZE2 = 2
+SHARED = 4
+SIZE = 5
+MINSIZE = 6
+
+#Rows needed to fit the model of a number of shared variables
+MIN_ROWS = 30
+LOG_SPACE = False
+
+
+def main():
+    global MIN_ROWS
+    global LOG_SPACE
+    if len(sys.argv) < 3:
+        help_err()
+        sys.exit()
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[3:], "lm:", ["log", "min-rows="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    for o, a in opts:
+        if o in ("-l", "--log"):
+            LOG_SPACE = True
+        if o in ("-m", "--min-rows"):
+            MIN_ROWS = int(a)
+
+    model = fit_model(sys.argv[1])
+    with open(sys.argv[2], "w") as handle:
+        json.dump(model, handle, indent=4)
+        handle.write("\n")
+    print_model(model)
+
+
+def fit_model(folder):
+    """
+    Fit the models of binary operations (size by the product of the sizes of
+    the operands for every number of shared variables) and the factors of
+    minimization (minsize by size of binary operations and by the size of
+    the operand of projections).
+    """
+    model = {"space": "log" if LOG_SPACE else "linear", "predict": dict(), "rows": dict()}
+    sizes = list()
+    minsizes = list()
+    for csv, oper in BIN_OPERATIONS.items():
+        data = load_csv(os.path.join(folder, csv))
+        product = data[:, SIZE1] * data[:, SIZE2]
+        model["predict"][oper] = fit_buckets(product, data[:, SIZE], data[:, SHARED].astype(int))
+        model["rows"][oper] = len(data)
+        sizes.append(data[:, SIZE])
+        minsizes.append(data[:, MINSIZE])
+    model["binary_factor"] = fit_factor(numpy.concatenate(sizes), numpy.concatenate(minsizes))
+
+    data = load_csv(os.path.join(folder, UN_OPERATION))
+    model["unary_factor"] = fit_factor(data[:, SIZE1], data[:, MINSIZE])
+    model["rows"]["Project"] = len(data)
+    return model
+
+
+def load_csv(filename):
+    #Rows without automata (sizes are not positive) are skipped
+    data = numpy.loadtxt(filename, delimiter=";", skiprows=1, ndmin=2)
+    return data[(data[:, SIZE1] > 0) & (data[:, SIZE] > 0) & (data[:, MINSIZE] > 0)]
+
+
+def fit_buckets(x, y, shared):
+    """
+    Fit slope * x + intercept for every number of shared variables up to the
+    largest one with at least MIN_ROWS rows and a positive slope (sizes grow
+    with the product). Other numbers get the model of the previous number
+    (the first fitted one for the lowest).
+    """
+    fitted = dict()
+    for bucket in range(shared.max(initial=0) + 1):
+        rows = shared == bucket
+        if numpy.count_nonzero(rows) >= MIN_ROWS:
+            line = fit_line(x[rows], y[rows])
+            if line[0] > 0:
+                fitted[bucket] = line
+    if not fitted:
+        fitted[0] = fit_line(x, y)
+        if fitted[0][0] <= 0:
+            sys.stderr.write("Warning: the model of all rows has a slope of {0}\n".format(fitted[0][0]))
+
+    models = list()
+    for bucket in range(max(fitted) + 1):
+        if bucket in fitted:
+            models.append(fitted[bucket])
+        else:
+            models.append(models[-1] if models else fitted[min(fitted)])
+    return models
+
+
+def fit_line(x, y):
+    if LOG_SPACE:
+        x, y = numpy.log(x), numpy.log(y)
+    matrix = numpy.stack([x, numpy.ones(len(x))], axis=1)
+    (slope, intercept), _, _, _ = numpy.linalg.lstsq(matrix, y, rcond=None)
+    return [round(float(slope), 4), round(float(intercept), 4)]
+
+
+def fit_factor(x, y):
+    """
+    Fit y = factor * x (in log space the factor is the geometric mean of y/x).
+    """
+    if LOG_SPACE:
+        return round(float(numpy.exp(numpy.mean(numpy.log(y) - numpy.log(x)))), 4)
+    return round(float(numpy.dot(x, y) / numpy.dot(x, x)), 4)
+
+
+def print_model(model):
+    print("Space: {0}".format(model["space"]))
+    y, x = ("log y", "log x") if model["space"] == "log" else ("y", "x")
+    for oper, models in model["predict"].items():
+        print("{0} ({1} rows):".format(oper, model["rows"][oper]))
+        for shared, (slope, intercept) in enumerate(models):
+            print("  {0: >2}: {1} = {2} * {3} {4:+}".format(shared, y, slope, x, intercept))
+    print("Binary factor: {0}".format(model["binary_factor"]))
+    print("Unary factor: {0} ({1} rows)".format(model["unary_factor"], model["rows"]["Project"]))
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./fit-model.py [csv folder] [model file] " +
+                     "[--log] [--min-rows=X]\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+ Sets of free variables as bitsets of interned variable names.
+ @title freevars.py
+"""
+
+#Bound of the tables of parsed strings (they are cleared once full)
+MAX_PARSED = 1 << 16
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+def shared(bits1, bits2):
+    """
+    Get the number of variables in both sets.
+    """
+    return popcount(bits1 & bits2)
+
+
+class VarTable:
+    """
+    Table interning variable names (such as #709) to dense ids. A set of
+    variables is an int with the bit i set iff the variable with id i is in
+    the set. Sets given as strings (transition labels of MONA, comma
+    separated lists) are parsed once and then looked up.
+    """
+
+    __slots__ = ("variables", "ids", "labels", "lists")
+
+    def __init__(self):
+        self.variables = list()
+        self.ids = dict()
+        self.labels = dict()
+        self.lists = dict()
+
+
+    def intern(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.variables)
+            self.variables.append(name)
+        return self.ids[name]
+
+
+    def bit(self, name):
+        return 1 << self.intern(name)
+
+
+    def bits(self, names):
+        """
+        Get the set of the given names (empty names are skipped).
+        """
+        bits = 0
+        for name in names:
+            if name != '':
+                bits |= 1 << self.intern(name)
+        return bits
+
+
+    def names(self, bits):
+        """
+        Get the names of a set in the order of their ids.
+        """
+        names = list()
+        while bits:
+            low = bits & -bits
+            names.append(self.variables[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+
+    def label_bits(self, label):
+        """
+        Get the variables of a transition label such as "#1=0, #2=1".
+        """
+        bits = self.labels.get(label)
+        if bits is None:
+            if len(self.labels) >= MAX_PARSED:
+                self.labels.clear()
+            bits = self.bits(sym.split('=')[0] for sym in label.strip().split(", ") if sym != '')
+            self.labels[label] = bits
+        return bits
+
+
+    def list_bits(self, text):
+        """
+        Get the variables of a comma separated list such as "#1,#2".
+        """
+        bits = self.lists.get(text)
+        if bits is None:
+            if len(self.lists) >= MAX_PARSED:
+                self.lists.clear()
+            bits = self.bits(text.split(','))
+            self.lists[text] = bits
+        return bits
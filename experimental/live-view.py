@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+ Live view of the progress of benchmark runs from their events (see
+ events.py): completed and remaining tasks, throughput, ETA and the slowest
+ running tasks.
+ @title live-view.py
+"""
+
+import sys
+import getopt
+import os
+import json
+import time
+import queue
+import threading
+import socketserver
+import collections
+
+#Seconds between refreshes of the view
+INTERVAL = 2.0
+#Number of the slowest running tasks shown
+SLOWEST = 5
+#Throughput is computed from the tasks finished in the last RATE_WINDOW seconds
+RATE_WINDOW = 600
+ONCE = False
+
+
+class EventHandler(socketserver.StreamRequestHandler):
+    """
+    Connection of a process emitting events to tcp:HOST:PORT.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            self.server.lines.put(line.decode("utf-8"))
+
+
+def main():
+    global INTERVAL
+    global SLOWEST
+    global ONCE
+    if len(sys.argv) < 2:
+        help_err()
+        sys.exit()
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[2:], "i:s:o", ["interval=", "slowest=", "once"])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    for o, a in opts:
+        if o in ("-i", "--interval"):
+            INTERVAL = float(a)
+        if o in ("-s", "--slowest"):
+            SLOWEST = int(a)
+        if o in ("-o", "--once"):
+            ONCE = True
+
+    lines = queue.Queue()
+    if sys.argv[1].startswith("tcp:"):
+        host, port = sys.argv[1][4:].rsplit(":", 1)
+        server = socketserver.ThreadingTCPServer((host, int(port)), EventHandler)
+        server.daemon_threads = True
+        server.lines = lines
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        threading.Thread(target=follow_file, args=(sys.argv[1], lines), daemon=True).start()
+
+    state = empty_state()
+    try:
+        while True:
+            ended = read_events(lines, state)
+            if ONCE and ended:
+                print_view(state, state["last"] or time.time())
+                break
+            if not ONCE:
+                print_view(state, time.time())
+    except KeyboardInterrupt:
+        pass
+
+
+def follow_file(filename, lines):
+    """
+    Put the lines of the file to the queue as they are written (and None at
+    the end of the file if the view is shown once).
+    """
+    while not os.path.exists(filename):
+        time.sleep(INTERVAL)
+    partial = ""
+    with open(filename, "r") as handle:
+        while True:
+            line = handle.readline()
+            if line.endswith("\n"):
+                lines.put(partial + line)
+                partial = ""
+            elif ONCE:
+                lines.put(None)
+                return
+            else:
+                partial += line
+                time.sleep(INTERVAL / 4)
+
+
+def empty_state():
+    return {
+        "total": 0,
+        "done": 0,
+        "outcomes": collections.Counter(),
+        #Start times of the running tasks by (pid, task)
+        "running": dict(),
+        #End times of the finished tasks
+        "ends": collections.deque(),
+        "first": None,
+        "last": None,
+    }
+
+
+def read_events(lines, state):
+    """
+    Update the state by the events read until the next refresh. Returns True
+    at the end of the events (only for a file shown once).
+    """
+    deadline = time.monotonic() + INTERVAL
+    while True:
+        try:
+            line = lines.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            return False
+        if line is None:
+            return True
+        try:
+            update_state(state, json.loads(line))
+        except (ValueError, KeyError):
+            continue
+
+
+def update_state(state, event):
+    kind = event["event"]
+    state["first"] = event["time"] if state["first"] is None else state["first"]
+    state["last"] = event["time"]
+    if kind == "sweep":
+        state["total"] += event["total"]
+    elif kind == "start":
+        state["running"][(event["pid"], event["task"])] = event["time"]
+    elif kind == "end":
+        state["running"].pop((event["pid"], event["task"]), None)
+        state["done"] += 1
+        state["outcomes"][event["outcome"]] += 1
+        state["ends"].append(event["time"])
+
+
+def print_view(state, now):
+    ends = state["ends"]
+    while ends and ends[0] < now - RATE_WINDOW:
+        ends.popleft()
+    window = min(RATE_WINDOW, now - state["first"]) if state["first"] is not None else 0
+    rate = len(ends) / window * 60 if window > 0 else 0.0
+    remaining = max(0, state["total"] - state["done"])
+
+    if sys.stdout.isatty():
+        sys.stdout.write("\033[H\033[J")
+    print("Tasks: {0}/{1} done, {2} running, {3} remaining".format(state["done"], state["total"], \
+        len(state["running"]), remaining))
+    print("Outcomes: {0}".format(", ".join("{0} {1}".format(outcome, count) \
+        for outcome, count in sorted(state["outcomes"].items())) or "none"))
+    print("Throughput: {0:.2f} tasks/min, ETA: {1}".format(rate, \
+        format_seconds(remaining / rate * 60) if rate > 0 else "N/A"))
+    slowest = sorted(state["running"].items(), key=lambda item: item[1])[:SLOWEST]
+    if slowest:
+        print("Slowest running:")
+    for (pid, task), start in slowest:
+        print("  {0: >9} {1} [{2}]".format(format_seconds(now - start), task, pid))
+    sys.stdout.flush()
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return "{0}h{1:02d}m{2:02d}s".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./live-view.py [events file|tcp:HOST:PORT] " +
+                     "[--interval=X] [--slowest=X] [--once]\n")
+
+
+if __name__ == "__main__":
+    main()
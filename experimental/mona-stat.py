@@ -13,18 +13,49 @@ import subprocess
 import string
 import re
 import os
+import time
 import resource
+import signal
+import threading
+import heapq
+import itertools
+import concurrent.futures
 import graphviz
 
+import monatrace
+import freevars
+import columns
+import runner
+import events
+
 TIMEOUT = 120 #in seconds
 FORMULAS = 400
 MAX_LABEL = 2000
 SHOW_MINIMIZED = True
 SHOW_NAMES = True
+FORMATS = ["npz", "csv"]
+OUTPUT_FORMAT = "npz"
+#Summary graphs: subtrees whose automata are all smaller than THRESHOLD states
+#are collapsed, only the TOP_PATHS most expensive paths (at most MAX_NODES
+#automata) are kept
+SUMMARY = False
+THRESHOLD = 100
+TOP_PATHS = 10
+MAX_NODES = 500
+SUMMARY_LABEL = 80
+#Graphs are rendered to SVG by RENDER_JOBS dot processes in the background
+RENDER = True
+RENDER_JOBS = os.cpu_count()
 
 
 def main():
     global FORMULAS
+    global OUTPUT_FORMAT
+    global SUMMARY
+    global THRESHOLD
+    global TOP_PATHS
+    global RENDER
+    global RENDER_JOBS
     if len(sys.argv) < 4:
         help_err()
         sys.exit()
@@ -34,7 +65,8 @@ def main():
     resultfolder = sys.argv[3]
 
     try:
-        opts, _ = getopt.getopt(sys.argv[4:], "f:", ["formulas="])
+        opts, _ = getopt.getopt(sys.argv[4:], "f:", ["formulas=", "format=", "summary", \
+            "threshold=", "top=", "no-render", "render-jobs=", "events="])
     except getopt.GetoptError as _:
         help_err()
         sys.exit()
@@ -42,6 +74,23 @@ def main():
     for o, a in opts:
         if o in ("-f", "--formulas"):
             FORMULAS = int(a)
+        if o == "--format":
+            if a not in FORMATS:
+                help_err()
+                sys.exit()
+            OUTPUT_FORMAT = a
+        if o == "--summary":
+            SUMMARY = True
+        if o == "--threshold":
+            THRESHOLD = int(a)
+        if o == "--top":
+            TOP_PATHS = int(a)
+        if o == "--no-render":
+            RENDER = False
+        if o == "--render-jobs":
+            RENDER_JOBS = int(a)
+        if o == "--events":
+            events.set_target(a)
 
     files = [f for f in os.listdir(formulafolder) \
         if os.path.isfile(os.path.join(formulafolder, f)) and \
@@ -51,36 +100,52 @@ def main():
 
     print_config()
 
+    renderer = concurrent.futures.ThreadPoolExecutor(RENDER_JOBS) if RENDER else None
+    renders = list()
+    events.sweep(len(files))
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
         print(filename, end="")
         sys.stdout.flush()
-        try:
-            mona_output = subprocess.check_output([monabin, "-i", filename], timeout=TIMEOUT).decode("utf-8")
-            mona_parse, names, _ = parse_mona(mona_output)
-        except subprocess.TimeoutExpired:
-            mona_parse = "TO"
-            print("\tTO")
-            sys.stdout.flush()
-            continue
-        except subprocess.CalledProcessError as _:
-            mona_parse = "None"
-            print("\tERROR")
+        with events.task(filename):
+            try:
+                data, names = run_mona([monabin, "-i", filename])
+            except subprocess.TimeoutExpired:
+                mona_parse = "TO"
+                print("\tTO")
+                sys.stdout.flush()
+                continue
+            except subprocess.CalledProcessError as _:
+                mona_parse = "None"
+                print("\tERROR")
+                sys.stdout.flush()
+                continue
+            fix_variables(data, names)
+            render = print_graph(filename, resultfolder, "", data, names, renderer)
+            if render is not None:
+                renders.append((filename, render))
+            add_all_freevars(data, names)
+            print_output(filename, resultfolder, "", data, names)
+            print("\tDONE")
             sys.stdout.flush()
-            continue
-        data = list(map(lambda x: x.split(';'), mona_parse.split('\n')[:-1]))
-        fix_variables(data, names)
-        print_graph(filename, resultfolder, "", data, names)
-        add_all_freevars(data, names)
-        mona_parse = '\n'.join([';'.join(item) for item in data])
-        print_output(filename, resultfolder, "", mona_parse, names)
-        print("\tDONE")
-        sys.stdout.flush()
+    events.finish()
+
+    if renderer is not None:
+        wait_renders(renders)
+        renderer.shutdown()
+
+
+def wait_renders(renders):
+    for filename, render in renders:
+        try:
+            render.result()
+        except (subprocess.CalledProcessError, OSError) as e:
+            print("{0}\tRENDER FAILED ({1})".format(filename, e))
 
 
 def fix_variables(data, names):
     for i in range(len(data)):
-        data[i][9] = ','.join(names[data[i][7]][2])
+        data[i][9] = ','.join(names[data[i][7]].fv)
 
 
 def add_all_freevars(data, names):
@@ -89,111 +154,270 @@ def add_all_freevars(data, names):
 
 
 def add_freevars(data, names):
-    return [data[0], data[1], data[2], '' if data[1] == '0x0' else ','.join(names[data[1]][2]),
-            data[3], data[4], '' if data[3] == '0x0' else ','.join(names[data[3]][2]),
-            data[5], data[6], '' if data[5] == '0x0' else ','.join(names[data[5]][2]),
-            data[7], data[8], '' if data[7] == '0x0' else ','.join(names[data[7]][2])]
-
-
-def format_op(op, params):
-    res = op
-    for par in params:
-        res = res + ";{0}".format(par)
-    return res
-
-
-def format_init(names):
-    res = ""
-    for id in names:
-        if names[id][3]:
-            res = res + "init;0x0;-1;0x0;-1;0x0;-1;" + id + ";" + names[id][1] + ";" + ','.join(names[id][2]) + ";\n"
-    return res
-
-
-def parse_mona(output):
-    res = ""
-    lines = output.split('\n')
-    variables = parse_variables(lines)
-    lines = lines[lines.index("AUTOMATON CONSTRUCTION"):]
+    return [data[0], data[1], data[2], '' if data[1] == '0x0' else ','.join(names[data[1]].fv),
+            data[3], data[4], '' if data[3] == '0x0' else ','.join(names[data[3]].fv),
+            data[5], data[6], '' if data[5] == '0x0' else ','.join(names[data[5]].fv),
+            data[7], data[8], '' if data[7] == '0x0' else ','.join(names[data[7]].fv)]
+
+
+def run_mona(params):
+    """
+    Run MONA and parse its trace while it is being produced. Returns the list of
+    construction records and the table of automata. MONA is recorded in the
+    events of the running task.
+    """
     names = dict()
-    j = 0
-    for i in range(len(lines)):
-        if j > 0:
-            j -= 1
-            continue
-        line = lines[i]
-        if is_initial_automaton(line):
-            proc_init(lines, i, names, variables)
-        if line.startswith("Copying"):
-            parse = proc_copy(lines, i, names)
-            res = res + "{0}\n".format(format_op("copy", parse))
-        if line.startswith("Replacing indices"):
-            proc_replace(lines, i, names)
-        if line.startswith("  Minimizing"):
-            parse = proc_minim(lines, i, names, variables)
-            res = res + "{0}\n".format(format_op("min", parse))
-        if line.startswith("Product &"):
-            parse = proc_product(lines, i, names, variables, "&")
-            res = res + "{0}\n".format(format_op("&", parse))
-            j = 6
-        if line.startswith("Product |"):
-            parse = proc_product(lines, i, names, variables, "|")
-            res = res + "{0}\n".format(format_op("|", parse))
-            j = 6
-        if line.startswith("Product <=>"):
-            parse = proc_product(lines, i, names, variables, "<=>")
-            res = res + "{0}\n".format(format_op("<=>", parse))
-            j = 6
-        if line.startswith("Product =>"):
-            parse = proc_product(lines, i, names, variables, "=>")
-            res = res + "{0}\n".format(format_op("=>", parse))
-            j = 6
-        if line.startswith("Projecting"):
-            var = re.match("Projecting (#[0-9]+)", line).group(1)
-            parse = parse_mona_projection(lines, i, names, variables, var)
-            res = res + "{0}\n".format(format_op("proj " + var, parse))
-            j = 6
-    res = format_init(names) + res
-    return res, names, variables
-
-
-def parse_variables(lines):
+    start = time.monotonic()
+    proc = subprocess.Popen(params, stdout=subprocess.PIPE, encoding="utf-8")
+    expired = threading.Event()
+    timer = threading.Timer(TIMEOUT, kill_expired, [proc, expired])
+    timer.start()
+    try:
+        data = list(parse_mona(proc.stdout, names))
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    usage = runner.get_usage(rusage, time.monotonic() - start)
+    #The timer may fire after MONA exits, only MONA it killed timed out
+    if expired.is_set() and proc.returncode == -signal.SIGKILL:
+        events.tool(params, events.TIMEOUT, usage)
+        raise subprocess.TimeoutExpired(params, TIMEOUT)
+    if proc.returncode != 0:
+        events.tool(params, events.ERROR, usage)
+        raise subprocess.CalledProcessError(proc.returncode, params)
+    events.tool(params, events.OK, usage)
+    return data, names
+
+
+def kill_expired(proc, expired):
+    expired.set()
+    proc.kill()
+
+
+class Automaton:
+    """
+    Node of the DAG of automata of a construction. The name is given by
+    pieces: strings and indices of operands, which are references (node,
+    version) to other automata. Substitutions of variables (Replacing
+    indices) are appended to substs; a reference sees only the first version
+    substitutions, the ones done before the automaton was used. A copy is
+    just a reference, names are rendered only when they are needed.
+    """
+
+    __slots__ = ("pieces", "operands", "substs", "fv")
+
+    def __init__(self, pieces, operands, fv):
+        self.pieces = pieces
+        self.operands = operands
+        self.substs = list()
+        self.fv = fv
+
+
+    def ref(self):
+        return (self, len(self.substs))
+
+
+    def name(self):
+        """
+        Render the name. Operands without substitutions are rendered into the
+        parts of their parent, so the time is linear in the length of the
+        name (and in the lengths of the renamed subterms).
+        """
+        result = list()
+        stack = [(self, len(self.substs), iter(self.pieces), result)]
+        while stack:
+            node, version, pieces, parts = stack[-1]
+            piece = next(pieces, None)
+            if piece is None:
+                stack.pop()
+                if version > 0:
+                    text = "".join(parts)
+                    for old, new in node.substs[:version]:
+                        text = text.replace(old, new)
+                    if not stack:
+                        return text
+                    stack[-1][3].append(text)
+            elif isinstance(piece, str):
+                parts.append(piece)
+            else:
+                child, child_version = node.operands[piece]
+                stack.append((child, child_version, iter(child.pieces), \
+                    list() if child_version > 0 else parts))
+        return "".join(result)
+
+
+def parse_mona(lines, names):
+    """
+    Parse the output of mona -i given as an iterable of lines (a single pass,
+    no line is kept after it was processed). A construction record is yielded
+    as soon as the block describing it ends; names is filled with the
+    automata seen so far.
+    """
     variables = dict()
-    for i in range(len(lines)):
-        line = lines[i]
-        if line.startswith("Symbol table:"):
-            variables = parse_var_table(lines[i+3:])
-    return variables
+    table = freevars.VarTable()
+    lines = iter(lines)
+    for line in lines:
+        kind, _ = monatrace.classify(line.rstrip("\n"))
+        if kind == monatrace.CONSTRUCTION:
+            break
+        if kind == monatrace.SYMBOL_TABLE:
+            variables = parse_var_table(lines)
+    block = None
+    for line in lines:
+        kind, match = monatrace.classify(line.rstrip("\n"))
+        if block is not None:
+            if proc_block_line(block, kind, match, table):
+                continue
+            record = close_block(block, names, variables, table)
+            if record is not None:
+                yield record
+        block = open_block(kind, match, names)
+    if block is not None:
+        record = close_block(block, names, variables, table)
+        if record is not None:
+            yield record
 
 
 def parse_var_table(lines):
     variables = dict()
+    next(lines, None)
+    next(lines, None)
     for line in lines:
+        line = line.rstrip("\n")
         if line == "":
             break
         line = line.split()
         variables[line[1]] = line[0]
     return variables
-        
 
-def is_initial_automaton(line):
-    initial_automata = ["True", "False", "Empty", "FirstOrder", "Const",
-                        "Singleton", "BoolVar", "In(", "Eq1", "Eq2", "Sub2",
-                        "Less1", "LessEq1", "EqPlus2", "EqMinus2", "EqMin",
-                        "EqMax", "EqPlus1", "EqMinus1", "Union", "Inter",
-                        "SetMinus", "EqPlusModulo", "EqMinusModulo", "PresbConst",
-                        "InStateSpace", "Root", "WellFormedTree"]
-    return any([line.startswith(automaton) for automaton in initial_automata])
 
-
-def proc_init(lines, i, names, variables):
-    name = lines[i]
-    match = re.match(r"Automaton \(([0-9]+),([0-9]+),([0-9]+)\)", lines[i+1])
-    size, id = match.group(1), match.group(3)
-    logic = "ws1s" if lines[i+2] == "Resulting DFA:" else "ws2s"
-    fv = get_fv(lines[i+3:], logic)
-    fv = replace_names(fv, variables)
-    names[id] = [name, size, fv, True]
+def open_block(kind, match, names):
+    """
+    Start a new block if the line is a header of a construction step.
+    """
+    if kind not in OPEN_BLOCK:
+        return None
+    block = OPEN_BLOCK[kind](match, names)
+    block["kind"] = kind
+    block["body"] = False
+    block["fv"] = 0
+    return block
+
+
+def open_init(match, names):
+    return {"op": "init", "name": match.string}
+
+
+def open_copy(match, names):
+    return {"op": "copy", "parse": proc_copy(match.string, names)}
+
+
+def open_replace(match, names):
+    id = monatrace.REPLACE_LINE.match(match.string).group(2)
+    return {"op": "replace", "id": id, "repl": list()}
+
+
+def open_minim(match, names):
+    return {"op": "min", "parse": parse_mona_minim(match.string)}
+
+
+def open_product(match, names):
+    return {"op": match.group("op"), "parse": None, "min": None}
+
+
+def open_projection(match, names):
+    var = match.group("var")
+    return {"op": "proj " + var, "var": var, "parse": None, "min": None}
+
+
+OPEN_BLOCK = {
+    monatrace.INIT: open_init,
+    monatrace.COPY: open_copy,
+    monatrace.REPLACE: open_replace,
+    monatrace.MINIMIZE: open_minim,
+    monatrace.PRODUCT: open_product,
+    monatrace.PROJECT: open_projection,
+}
+
+
+def proc_block_line(block, kind, match, table):
+    """
+    Process a line inside an open block. Returns False if the line does not
+    belong to the block (i.e., the block ends).
+    """
+    if block["body"]:
+        return proc_body_line(block, kind, match, table)
+    if kind == monatrace.RESULT:
+        block["body"] = True
+        return True
+    if kind == monatrace.SUBST:
+        if block["kind"] != monatrace.REPLACE:
+            return False
+        block["repl"].append([match.group("old"), match.group("new")])
+        return True
+    if kind == monatrace.AUTOMATON:
+        if block["kind"] == monatrace.INIT:
+            aut = monatrace.AUTOMATON_LINE.match(match.string)
+            block["size"], block["id"] = aut.group(1), aut.group(2)
+        return True
+    if block["kind"] not in (monatrace.PRODUCT, monatrace.PROJECT):
+        return False
+    if kind == monatrace.MINIMIZE:
+        block["min"] = parse_mona_minim(match.string)
+        return True
+    if kind == monatrace.INDENTED:
+        if block["kind"] == monatrace.PROJECT:
+            parse = parse_mona_projection(match.string)
+        else:
+            parse = parse_mona_product(match.string)
+        if parse is not None:
+            block["parse"] = parse
+        return True
+    return False
+
+
+def proc_body_line(block, kind, match, table):
+    if kind == monatrace.DFA_TRANS or kind == monatrace.GTA_TRANS:
+        block["fv"] |= table.label_bits(monatrace.transition_text(kind, match))
+        return True
+    return kind == monatrace.BODY
+
+
+def close_block(block, names, variables, table):
+    """
+    Finish a block: update the table of automata and return the corresponding
+    construction record (None if there is nothing to record).
+    """
+    fv = replace_names(table.names(block["fv"]), variables)
+    op = block["op"]
+    if op == "init":
+        if "id" not in block:
+            return None
+        names[block["id"]] = Automaton([block["name"]], (), fv)
+        return ["init", "0x0", "-1", "0x0", "-1", "0x0", "-1", block["id"],
+                block["size"], ','.join(fv)]
+    if op == "copy":
+        parse = block["parse"]
+        return ["copy"] + parse + [','.join(names[parse[6]].fv)]
+    if op == "replace":
+        proc_replace(block["id"], block["repl"], names)
+        return None
+    if op == "min":
+        return proc_minim(block["parse"], names, fv)
+    if block["parse"] is None or block["min"] is None:
+        return None
+    parse = block["parse"]
+    parse[6], parse[7] = block["min"][6], block["min"][7]
+    if op.startswith("proj"):
+        result = Automaton(["proj " + block["var"] + "(", 0, ")"], (names[parse[0]].ref(),), fv.copy())
+    else:
+        result = Automaton([0, " " + op + " ", 1], (names[parse[0]].ref(), names[parse[2]].ref()), \
+            fv.copy())
+    names[parse[4]] = result
+    names[parse[6]] = Automaton(["min(", 0, ")"], (result.ref(),), fv)
+    return [op] + parse + [','.join(fv)]
 
 
 def replace_names(fv, variables):
@@ -203,169 +427,71 @@ def replace_names(fv, variables):
         return sorted(fv)
 
 
-def proc_copy(lines, i, names):
-    parse = parse_mona_copy(lines[i])
-    match = re.match(r".*\(([0-9]+),([0-9]+),([0-9]+)\).*\(([0-9]+),([0-9]+),([0-9]+)\)", lines[i])
-    orig, copy = match.group(3), match.group(6)
-    names[copy] = names[orig][:]
-    names[copy][2] = names[copy][2].copy()
-    names[copy][3] = False
-    parse.append(','.join(names[copy][2]))
+def proc_copy(line, names):
+    parse = parse_mona_copy(line)
+    orig, copy = parse[0], parse[6]
+    names[copy] = Automaton([0], (names[orig].ref(),), names[orig].fv.copy())
     return parse
 
 
 def parse_mona_copy(line):
     res = [None]*8
-    match = re.match(r".*\(([0-9]+),[0-9]+,([0-9]+)\).*\(([0-9]+),[0-9]+,([0-9]+)\)", line)
+    match = monatrace.COPY_LINE.match(line)
     if match is None:
         return None
     res[0], res[1], res[2] = match.group(2), match.group(1), "0x0"
-    res[3], res[4], res[5] = -1, "0x0", -1
+    res[3], res[4], res[5] = "-1", "0x0", "-1"
     res[6], res[7] = match.group(4), match.group(3)
     return res
 
 
-def proc_replace(lines, i, names):
-    match = re.match(r".*\(([0-9]+),([0-9]+),([0-9]+)\)", lines[i])
-    id = match.group(3)
-    replacements = list()
-    for line in lines[i+1:]:
-        match = re.match(r"\[(#[0-9]+)->(#[0-9]+)\]", line)
-        if match is None:
-            break
-        replacements.append([match.group(1), match.group(2)])
+def proc_replace(id, replacements, names):
+    if id not in names:
+        return
+    automaton = names[id]
     replacements.reverse()
     for item in replacements:
-        names[id][0] = names[id][0].replace(item[0], item[1])
-        if item[0] in names[id][2]:
-            names[id][2].remove(item[0])
-            names[id][2].append(item[1])
-    names[id][2] = sorted(names[id][2])
-
-
-def proc_minim(lines, i, names, variables):
-    parse = parse_mona_minim(lines[i])
-    logic = "ws1s" if lines[i+1] == "Resulting DFA:" else "ws2s"
-    j = i+2
-    fv = get_fv(lines[j:], logic)
-    fv = replace_names(fv, variables)
-    parse.append(','.join(fv))
-    name = "min(" + names[parse[0]][0] + ")"
-    names[parse[6]] = [name, parse[7], fv, False]
-    return parse
+        automaton.substs.append(tuple(item))
+        if item[0] in automaton.fv:
+            automaton.fv.remove(item[0])
+            automaton.fv.append(item[1])
+    automaton.fv = sorted(automaton.fv)
+
+
+def proc_minim(parse, names, fv):
+    names[parse[6]] = Automaton(["min(", 0, ")"], (names[parse[0]].ref(),), fv)
+    return ["min"] + parse + [','.join(fv)]
 
 
 def parse_mona_minim(line):
     res = [None]*8
-    match = re.match("  Minimizing \\(([0-9]+),[0-9]+,([0-9a-f]+)\\) -> \\(([0-9]+),[0-9]+,([0-9a-f]+)\\)", line)
+    match = monatrace.MINIMIZE_LINE.search(line)
     if match is None:
         return None
     res[0], res[1], res[2] = match.group(2), match.group(1), "0x0"
-    res[3], res[4], res[5] = -1, "0x0", -1
+    res[3], res[4], res[5] = "-1", "0x0", "-1"
     res[6], res[7] = match.group(4), match.group(3)
     return res
 
 
-def proc_product(lines, i, names, variables, operation):
-    parse = parse_mona_product(lines[i+3:i+5])
-    logic = "ws1s" if lines[i+5] == "Resulting DFA:" else "ws2s"
-    j = i+6
-    if parse is None:
-        parse = parse_mona_product(lines[i+1:i+3])
-        logic = "ws1s" if lines[i+3] == "Resulting DFA:" else "ws2s"
-        j = i+4
-    fv = get_fv(lines[j:], logic)
-    fv = replace_names(fv, variables)
-    parse.append(','.join(fv))
-    name = names[parse[0]][0] + " " + operation + " " + names[parse[2]][0]
-    min_name = "min(" + name + ")"
-    names[parse[4]] = [name, parse[5], fv.copy(), False]
-    names[parse[6]] = [min_name, parse[7], fv, False]
-    return parse
-
-
-def parse_mona_product(lines):
+def parse_mona_product(line):
     res = [None]*8
-    match = re.search("\\(([0-9]+),[0-9]+,([0-9a-f]+)\\)x\\(([0-9]+),[0-9]+,([0-9a-f]+)\\) -> \\(([0-9]+),[0-9]+,([0-9a-f]+)\\)", lines[0])
+    match = monatrace.PRODUCT_LINE.search(line)
     if match is None:
         return None
     res[0], res[1], res[2] = match.group(2), match.group(1), match.group(4)
     res[3], res[4], res[5] = match.group(3), match.group(6), match.group(5)
-    match = re.search("Minimizing \\([0-9]+,[0-9]+,[0-9a-f]+\\) -> \\(([0-9]+),[0-9]+,([0-9a-f]+)\\)", lines[1])
-    if match is None:
-        return None
-    res[6], res[7] = match.group(2), match.group(1)
     return res
 
 
-def parse_mona_projection(lines, i, names, variables, var):
+def parse_mona_projection(line):
     res = [None]*8
-    match = re.search("\\(([0-9]+),[0-9]+,([0-9a-f]+)\\) -> \\(([0-9]+),[0-9]+,([0-9a-f]+)\\)", lines[i+3])
-    res[0], res[1], res[2] = match.group(2), match.group(1), "0x0"
-    res[3], res[4], res[5] = -1, match.group(4), match.group(3)
-    match = re.search("Minimizing \\([0-9]+,[0-9]+,[0-9a-f]+\\) -> \\(([0-9]+),[0-9]+,([0-9a-f]+)\\)", lines[i+4])
-    res[6], res[7] = match.group(2), match.group(1)
-    logic = "ws1s" if lines[i+5] == "Resulting DFA:" else "ws2s"
-    fv = get_fv(lines[i+6:], logic)
-    fv = replace_names(fv, variables)
-    res.append(','.join(fv))
-    name = "proj " + var + "(" + names[res[0]][0] + ")"
-    min_name = "min(" + name + ")"
-    names[res[4]] = [name, res[5], fv.copy(), False]
-    names[res[6]] = [min_name, res[7], fv, False]
-    return res
-
-
-def get_fv(lines, parser):
-    fv = set()
-    if parser == "ws1s":
-        for line in lines[5:]:
-            ret = parse_dfa_trans(line)
-            if ret is None:
-                break
-            _, sym, _ = ret
-            fv = fv.union(symbols_free_vars(sym))
-    else:
-        for line in lines[4:]:
-            if line == "" or re.match("(State space.*)|(Initial state:.*)|(Transitions:)", line) is not None:
-                continue
-            ret = parse_gta_trans(line)
-            if ret is None:
-                break
-            _, sym, _ = ret
-            fv = fv.union(symbols_free_vars(sym))
-    return fv
-
-
-def parse_dfa_trans(line):
-    match = re.search("^State ([0-9]+): ([^->]*) -> state ([0-9]+)$", line)
+    match = monatrace.PROJECT_LINE.search(line)
     if match is None:
         return None
-    fr, label, to = int(match.group(1)), match.group(2), match.group(3)
-    if label.strip() == "":
-        syms = []
-    else:
-        syms = label.split(", ")
-    return fr, syms, to
-
-
-def parse_gta_trans(line):
-    match = re.search(r"^\(([0-9]+,[0-9]+,)([^->]*)\) -> ([0-9]+)$", line)
-    if match is None:
-        return None
-    fr, label, to = match.group(1), match.group(2), match.group(3)
-    if label.strip() == "":
-        syms = []
-    else:
-        syms = label.split(", ")
-    return fr, syms, to
-
-
-def symbols_free_vars(syms):
-    fv = set()
-    for sym in syms:
-        fv.add(sym.split("=")[0])
-    return fv
+    res[0], res[1], res[2] = match.group(2), match.group(1), "0x0"
+    res[3], res[4], res[5] = "-1", match.group(4), match.group(3)
+    return res
 
 
 def make_graph(name, data, names):
@@ -384,37 +510,148 @@ def make_graph(name, data, names):
     return graph
 
 
+def automata_dag(data):
+    """
+    Get the automata of the records (before add_all_freevars) as a DAG: an
+    automaton id maps to [operation, size, children].
+    """
+    nodes = dict()
+    for item in data:
+        op, node = item[0], item[1:]
+        if op == 'init':
+            nodes[node[6]] = [op, int(node[7]), []]
+        elif op.startswith('min') or op.startswith('copy'):
+            nodes[node[6]] = [op, int(node[7]), [node[0]]]
+        elif op.startswith('proj'):
+            nodes[node[4]] = [op, int(node[5]), [node[0]]]
+            nodes[node[6]] = ["min", int(node[7]), [node[4]]]
+        else:
+            nodes[node[4]] = [op, int(node[5]), [node[0], node[2]]]
+            nodes[node[6]] = ["min", int(node[7]), [node[4]]]
+    for node in nodes.values():
+        node[2] = [child for child in node[2] if child in nodes]
+    return nodes
+
+
+def postorder(nodes):
+    """
+    Get the automata with children before their parents (an edge closing a
+    cycle, possible if MONA reuses an id, is ignored).
+    """
+    order = list()
+    state = dict()
+    for start in nodes:
+        if start in state:
+            continue
+        stack = [(start, iter(nodes[start][2]))]
+        state[start] = False
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                state[node] = True
+                order.append(node)
+            elif child not in state:
+                state[child] = False
+                stack.append((child, iter(nodes[child][2])))
+    return order
+
+
+def summary_paths(nodes):
+    """
+    Find the most expensive paths (by the sum of states) from the roots
+    best-first. Subtrees whose automata all have less than THRESHOLD states
+    are not entered. Returns the kept automata, the largest automaton of
+    every subtree and the cost of its most expensive path.
+    """
+    largest = dict()
+    cost = dict()
+    for node in postorder(nodes):
+        _, size, children = nodes[node]
+        children = [child for child in children if child in cost]
+        largest[node] = max([size] + [largest[child] for child in children])
+        cost[node] = size + max([cost[child] for child in children if largest[child] >= THRESHOLD], \
+            default=0)
+
+    children_of = set(child for node in nodes.values() for child in node[2])
+    counter = itertools.count()
+    heap = [(-cost[root], next(counter), root, None, 0) for root in nodes if root not in children_of]
+    heapq.heapify(heap)
+    kept = set()
+    paths = 0
+    while heap and paths < TOP_PATHS and len(kept) < MAX_NODES:
+        _, _, node, path, prefix = heapq.heappop(heap)
+        path = (node, path)
+        prefix += nodes[node][1]
+        children = [child for child in nodes[node][2] if largest[child] >= THRESHOLD]
+        if not children:
+            paths += 1
+            while path is not None and len(kept) < MAX_NODES:
+                kept.add(path[0])
+                path = path[1]
+            continue
+        for child in children:
+            heapq.heappush(heap, (-(prefix + cost[child]), next(counter), child, path, prefix))
+    return kept, largest, cost
+
+
+def make_summary_graph(name, data, names):
+    """
+    Graph of the most expensive paths of the construction. Children that
+    are not kept are drawn as a single box with the size of the largest
+    automaton of their subtree.
+    """
+    nodes = automata_dag(data)
+    kept, largest, cost = summary_paths(nodes)
+    graph = graphviz.Digraph(name)
+    collapsed = set()
+    for node in [node for node in nodes if node in kept]:
+        op, size, children = nodes[node]
+        label = names[node].name()[:SUMMARY_LABEL] if node in names else node
+        fv = ','.join(names[node].fv) if node in names else ''
+        graph.node(node, label=format_node(node, str(size), fv), tooltip=label)
+        for child in children:
+            if child not in kept and child not in collapsed:
+                collapsed.add(child)
+                graph.node("c" + child, label="{0} states max\\npath {1}\\n{2}".format( \
+                    largest[child], cost[child], child), shape="box", color="gray")
+            target = child if child in kept else "c" + child
+            graph.edge(node, target, label=graphviz.nohtml(op.split()[0]), arrowhead="none")
+    return graph
+
+
 def process_initial(graph, names, node):
-    create_leaf_node(graph, node[6], names[node[6]][0], node[7], ','.join(names[node[6]][2]))
+    create_leaf_node(graph, node[6], names[node[6]].name(), node[7], ','.join(names[node[6]].fv))
 
 
 def process_minimization(graph, names, node, operation):
-    create_unary_node(graph, node[6], names[node[6]][0], node[7], ','.join(names[node[6]][2]), node[0], "min")
+    create_unary_node(graph, node[6], names[node[6]].name(), node[7], ','.join(names[node[6]].fv), node[0], "min")
 
 
 def process_projection(graph, names, node, operation):
-    name = names[node[4]][0]
-    min_name = names[node[6]][0]
+    name = names[node[4]].name()
+    min_name = names[node[6]].name()
     if SHOW_MINIMIZED:
-        create_unary_node(graph, node[4], name, node[5], ','.join(names[node[4]][2]), node[0], operation)
-        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]][2]), node[4], "min")
+        create_unary_node(graph, node[4], name, node[5], ','.join(names[node[4]].fv), node[0], operation)
+        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]].fv), node[4], "min")
     else:
-        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]][2]), node[0], "min + " + operation)
+        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]].fv), node[0], "min + " + operation)
 
 
 def process_copy(graph, names, node, operation):
-    name = names[node[6]][0]
-    create_copy_node(graph, node[6], name, node[7], ','.join(names[node[6]][2]), node[0], operation)
+    name = names[node[6]].name()
+    create_copy_node(graph, node[6], name, node[7], ','.join(names[node[6]].fv), node[0], operation)
 
     
 def process_product(graph, names, node, operation):
-    name = names[node[4]][0]
-    min_name = names[node[6]][0]
+    name = names[node[4]].name()
+    min_name = names[node[6]].name()
     if SHOW_MINIMIZED:
-        create_binary_node(graph, node[4], name, node[5], ','.join(names[node[4]][2]), node[0], node[2], operation)
-        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]][2]), node[4], "min")
+        create_binary_node(graph, node[4], name, node[5], ','.join(names[node[4]].fv), node[0], node[2], operation)
+        create_unary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]].fv), node[4], "min")
     else:
-        create_binary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]][2]), node[0], node[2], operation)
+        create_binary_node(graph, node[6], min_name, node[7], ','.join(names[node[6]].fv), node[0], node[2], operation)
 
 
 def create_leaf_node(graph, name, label, size, free_vars):
@@ -454,34 +691,55 @@ def format_copy_node(name, size, free_vars):
 def print_config():
     print("Timeout: {0}".format(TIMEOUT))
     print("Number of formulas: {0}".format(FORMULAS))
-
-
-def print_graph(filename, folder, suf, data, names):
+    print("Output format: {0}".format(OUTPUT_FORMAT))
+    print("Rendering: {0}".format("{0} jobs".format(RENDER_JOBS) if RENDER else "off"))
+    if SUMMARY:
+        print("Summary graphs: threshold {0} states, top {1} paths, at most {2} automata".format( \
+            THRESHOLD, TOP_PATHS, MAX_NODES))
+
+
+def print_graph(filename, folder, suf, data, names, renderer=None):
+    """
+    Save the graph of the construction as a .dot file. If there is a
+    renderer, rendering to SVG is queued and its future is returned.
+    """
     base = os.path.basename(filename)
     name = os.path.splitext(base)[0]
     name = os.path.join(folder, name)
-    graph = make_graph(name, data, names)
-    graph.render(filename=name, format="svg", cleanup=True)
+    if SUMMARY:
+        graph = make_summary_graph(name, data, names)
+    else:
+        graph = make_graph(name, data, names)
     graph.save(filename=name + ".dot")
-    
+    if renderer is None:
+        return None
+    return renderer.submit(render_dot, name + ".dot", name + ".svg")
+
+
+def render_dot(dotfile, svgfile):
+    subprocess.run(["dot", "-Tsvg", dotfile, "-o", svgfile], stdout=subprocess.DEVNULL, check=True)
+
 
-def print_output(filename, folder, suf, output, names):
+def print_output(filename, folder, suf, data, names):
     base = os.path.basename(filename)
     name = os.path.splitext(base)[0]
     name = os.path.join(folder, name)
-    output = "operation;operand1;size1;fv1;operand2;size2;fv2;result;resultsize;fvr;minresult;minsize;fvm\n" + output
+    if OUTPUT_FORMAT == "npz":
+        columns.write_records(name + suf + columns.EXTENSION, data, \
+            {id: item.name() for id, item in names.items()} if SHOW_NAMES else dict())
+        return
+    output = [";".join(columns.HEADER) + "\n", "\n".join(";".join(item) for item in data)]
     if SHOW_NAMES:
-        res = ""
-        for id, item in names.items():
-            res = res + id + ";" + item[0] + ";\n"
-        output = output + "\n\nAutomata\nid;name;\n" + res
-    f = open(name + suf + ".csv", "w")
-    f.write(output)
-    f.close()
+        output.append("\n\nAutomata\nid;name;\n")
+        output += [id + ";" + item.name() + ";\n" for id, item in names.items()]
+    with open(name + suf + ".csv", "w") as f:
+        f.write("".join(output))
 
 
 def help_err():
-    sys.stderr.write("Bad input arguments. \nFormat: ./mona-stat.py [mona-bin] [formula folder] [output folder]\n")
+    sys.stderr.write("Bad input arguments. \nFormat: ./mona-stat.py [mona-bin] [formula folder] [output folder] " +
+                     "[--formulas=X] [--format=npz|csv] [--summary] [--threshold=X] [--top=X] " +
+                     "[--no-render] [--render-jobs=X] [--events=FILE|tcp:HOST:PORT]\n")
 
 
 if __name__ == "__main__":
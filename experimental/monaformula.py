@@ -0,0 +1,247 @@
+"""
+ Native parser of the subset of the MONA input language used by the
+ benchmarks. It produces the formula line printed by mona -a, so the
+ predictor does not need to run MONA.
+ @title monaformula.py
+"""
+
+import re
+
+HEADERS = ["ws1s", "ws2s"]
+DECLARATIONS = {"var0": 0, "var1": 1, "var2": 2}
+QUANTIFIERS = {"ex0": 0, "ex1": 1, "ex2": 2, "all0": 0, "all1": 1, "all2": 2}
+#Binary connectives from the lowest priority: token, operation, right associative
+BINARY = [
+    ("<=>", "Biimpl", False),
+    ("=>", "Impl", True),
+    ("|", "Or", False),
+    ("&", "And", False),
+]
+ATOMS = ["sub", "in", "notin", "=", "~=", "<", "<=", ">", ">="]
+
+COMMENT = re.compile(r"#[^\n]*|/\*.*?\*/", re.DOTALL)
+TOKEN = re.compile(r"\s*(?:(?P<token><=>|=>|~=|<=|>=|[~&|=<>(),:;]|[A-Za-z_][A-Za-z0-9_]*)|(?P<bad>\S))")
+
+
+class UnsupportedFormula(ValueError):
+    """
+    Raised for inputs outside of the supported subset (predicates, terms,
+    types, ...); these have to be parsed by MONA.
+    """
+
+
+def tokenize(text):
+    tokens = list()
+    for match in TOKEN.finditer(COMMENT.sub("", text)):
+        if match.group("bad") is not None:
+            raise UnsupportedFormula("unsupported symbol {0}".format(match.group("bad")))
+        if match.group("token") is not None:
+            tokens.append(match.group("token"))
+    return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser of a MONA program. Variables are numbered in
+    the order of their declaration (#0, #1, ...) as MONA numbers them in
+    its symbol table; first-order quantifiers are restricted by FirstOrder.
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.scope = dict()
+        self.counter = 0
+
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise UnsupportedFormula("unexpected end of input")
+        self.pos += 1
+        return token
+
+
+    def expect(self, token):
+        if self.next() != token:
+            raise UnsupportedFormula("expected {0}".format(token))
+
+
+    def bind(self, name, order):
+        var = "#{0}".format(self.counter)
+        self.counter += 1
+        self.scope[name] = (var, order)
+        return var
+
+
+    def variable(self, name, order=None):
+        if name not in self.scope:
+            raise UnsupportedFormula("unknown identifier {0}".format(name))
+        var, var_order = self.scope[name]
+        if order is not None and var_order != order:
+            raise UnsupportedFormula("{0} is not of order {1}".format(name, order))
+        return var, var_order
+
+
+    def program(self):
+        """
+        Parse the whole program. Formulas of the program are conjoined as
+        MONA does.
+        """
+        if self.peek() in HEADERS:
+            self.next()
+            self.expect(";")
+        formulas = list()
+        free_first_order = list()
+        while self.peek() is not None:
+            if self.peek() in DECLARATIONS:
+                order = DECLARATIONS[self.next()]
+                for name in self.names():
+                    var = self.bind(name, order)
+                    if order == 1:
+                        free_first_order.append(var)
+            else:
+                formulas.append(self.formula())
+            self.expect(";")
+        if len(formulas) == 0:
+            raise UnsupportedFormula("no formula")
+
+        result = formulas[0]
+        for formula in formulas[1:]:
+            result = "And({0},{1})".format(result, formula)
+        for var in free_first_order:
+            result = restrict_first_order(result, var)
+        return result
+
+
+    def names(self):
+        names = [self.next()]
+        while self.peek() == ",":
+            self.next()
+            names.append(self.next())
+        return names
+
+
+    def formula(self, level=0):
+        if level == len(BINARY):
+            return self.unary()
+        token, oper, right = BINARY[level]
+        left = self.formula(level + 1)
+        if right:
+            if self.peek() == token:
+                self.next()
+                return "{0}({1},{2})".format(oper, left, self.formula(level))
+            return left
+        while self.peek() == token:
+            self.next()
+            left = "{0}({1},{2})".format(oper, left, self.formula(level + 1))
+        return left
+
+
+    def unary(self):
+        token = self.peek()
+        if token == "~":
+            self.next()
+            return "Negate({0})".format(self.unary())
+        if token in QUANTIFIERS:
+            return self.quantifier()
+        if token == "(":
+            self.next()
+            formula = self.formula()
+            self.expect(")")
+            return formula
+        return self.atom()
+
+
+    def quantifier(self):
+        """
+        ex X: f is Project(X, f), all X: f is ~ex X: ~f. The quantified
+        variables are projected in the order of the list.
+        """
+        kind = self.next()
+        order = QUANTIFIERS[kind]
+        names = self.names()
+        self.expect(":")
+        saved = {name: self.scope.get(name) for name in names}
+        variables = [self.bind(name, order) for name in names]
+        body = self.formula()
+        for name, value in saved.items():
+            if value is None:
+                del self.scope[name]
+            else:
+                self.scope[name] = value
+
+        if kind.startswith("all"):
+            body = "Negate({0})".format(body)
+        for var in reversed(variables):
+            if order == 1:
+                body = restrict_first_order(body, var)
+            body = "Project({0},{1})".format(var, body)
+        if kind.startswith("all"):
+            body = "Negate({0})".format(body)
+        return body
+
+
+    def atom(self):
+        token = self.next()
+        if token == "true":
+            return "True()"
+        if token == "false":
+            return "False()"
+        if token == "empty":
+            self.expect("(")
+            var, _ = self.variable(self.next(), 2)
+            self.expect(")")
+            return "Empty({0})".format(var)
+
+        left, order = self.variable(token)
+        if order == 0:
+            return "BoolVar({0})".format(left)
+        oper = self.next()
+        if oper not in ATOMS:
+            raise UnsupportedFormula("unsupported operation {0}".format(oper))
+        right, right_order = self.variable(self.next())
+
+        if oper in ["in", "notin"]:
+            if order != 1 or right_order != 2:
+                raise UnsupportedFormula("{0} expects a first and a second-order variable".format(oper))
+            atom = "In({0},{1})".format(left, right)
+            return atom if oper == "in" else "Negate({0})".format(atom)
+        if order != right_order:
+            raise UnsupportedFormula("{0} of variables of different orders".format(oper))
+        if oper == "sub" and order == 2:
+            return "Sub2({0},{1})".format(left, right)
+        if oper in ["=", "~="]:
+            atom = "Eq{0}({1},{2})".format(order, left, right)
+            return atom if oper == "=" else "Negate({0})".format(atom)
+        if order == 1:
+            return {
+                "<": "Less1({0},{1})",
+                "<=": "LessEq1({0},{1})",
+                ">": "Less1({1},{0})",
+                ">=": "LessEq1({1},{0})",
+            }[oper].format(left, right)
+        raise UnsupportedFormula("unsupported operation {0}".format(oper))
+
+
+def restrict_first_order(formula, var):
+    return "And({0},Restrict(FirstOrder({1})))".format(formula, var)
+
+
+def parse_formula(text):
+    """
+    Get the formula line of mona -a for a MONA program (UnsupportedFormula
+    is raised if the program is out of the supported subset).
+    """
+    return Parser(text).program()
+
+
+def parse_file(filename):
+    with open(filename, "r") as handle:
+        return parse_formula(handle.read())
@@ -0,0 +1,108 @@
+"""
+ Classification of lines of MONA output shared by the statistics scripts.
+ @title monatrace.py
+"""
+
+import re
+
+INITIAL_AUTOMATA = ["True", "False", "Empty", "FirstOrder", "Const",
+                    "Singleton", "BoolVar", "In(", "Eq1", "Eq2", "Sub2",
+                    "Less1", "LessEq1", "EqPlus2", "EqMinus2", "EqMin",
+                    "EqMax", "EqPlus1", "EqMinus1", "Union", "Inter",
+                    "SetMinus", "EqPlusModulo", "EqMinusModulo", "PresbConst",
+                    "InStateSpace", "Root", "WellFormedTree", "Dot0", "Dot1"]
+PRODUCTS = ["&", "|", "<=>", "=>"]
+BODY_LINES = ["Accepting states", "Rejecting states", "Don't-care states",
+              "Initial state", "State space", "Automaton has", "Transitions"]
+
+#Kinds of lines of mona -i output
+CONSTRUCTION = "construction"
+SYMBOL_TABLE = "symtab"
+INIT = "init"
+COPY = "copy"
+REPLACE = "replace"
+MINIMIZE = "min"
+PRODUCT = "product"
+PROJECT = "proj"
+AUTOMATON = "automaton"
+RESULT = "result"
+SUBST = "subst"
+DFA_TRANS = "dfatrans"
+GTA_TRANS = "gtatrans"
+BODY = "body"
+INDENTED = "indented"
+
+#Kinds of lines of the final MONA verdict
+UNSAT = "unsat"
+SAT = "sat"
+TIME = "time"
+
+#Automaton triple (states, BDD nodes, id); older MONA prints only the pair
+AUT = r"\(([0-9]+),[0-9]+(?:,([0-9a-f]+))?\)"
+
+TRACE_LINE = re.compile("|".join([
+    r"(?P<{0}>AUTOMATON CONSTRUCTION$)".format(CONSTRUCTION),
+    r"(?P<{0}>Symbol table:)".format(SYMBOL_TABLE),
+    r"(?P<{0}>{1})".format(INIT, "|".join(map(re.escape, INITIAL_AUTOMATA))),
+    r"(?P<{0}>Copying)".format(COPY),
+    r"(?P<{0}>Replacing indices)".format(REPLACE),
+    r"(?P<{0}>  Minimizing)".format(MINIMIZE),
+    r"(?P<{0}>Product (?P<op>{1}))".format(PRODUCT, "|".join(map(re.escape, PRODUCTS))),
+    r"(?P<{0}>Projecting (?P<var>#[0-9]+))".format(PROJECT),
+    r"(?P<{0}>Automaton \()".format(AUTOMATON),
+    r"(?P<{0}>Resulting (?P<logic>DFA|GTA):)".format(RESULT),
+    r"(?P<{0}>\[(?P<old>#[0-9]+)->(?P<new>#[0-9]+)\])".format(SUBST),
+    r"(?P<{0}>State [0-9]+: (?P<dfalabel>[^->]*) -> state [0-9]+$)".format(DFA_TRANS),
+    r"(?P<{0}>\([0-9]+,[0-9]+,(?P<gtalabel>[^->]*)\) -> [0-9]+$)".format(GTA_TRANS),
+    r"(?P<{0}>{1}|$)".format(BODY, "|".join(map(re.escape, BODY_LINES))),
+    r"(?P<{0}> )".format(INDENTED),
+]))
+
+RESULT_LINE = re.compile("|".join([
+    r"(?P<{0}>Formula is unsatisfiable)".format(UNSAT),
+    r"(?P<{0}>A satisfying example)".format(SAT),
+    r"(?P<{0}>Time: (?P<hours>[0-9][0-9]):(?P<minutes>[0-9][0-9]):(?P<seconds>[0-9][0-9].[0-9][0-9]))".format(TIME),
+]))
+
+AUTOMATON_LINE = re.compile(r"Automaton " + AUT)
+COPY_LINE = re.compile(r".*" + AUT + r".*" + AUT)
+REPLACE_LINE = re.compile(r"Replacing indices " + AUT)
+MINIMIZE_LINE = re.compile(r"Minimizing " + AUT + " -> " + AUT)
+PRODUCT_LINE = re.compile(AUT + "x" + AUT + " -> " + AUT)
+PROJECT_LINE = re.compile(AUT + " -> " + AUT)
+
+
+def classify(line):
+    """
+    Classify a line of mona -i output. Returns the kind of the line (None for
+    lines that are not recognised) and the match object.
+    """
+    match = TRACE_LINE.match(line)
+    if match is None:
+        return None, None
+    return match.lastgroup, match
+
+
+def classify_result(line):
+    """
+    Classify a line of the final MONA output (verdict and time).
+    """
+    match = RESULT_LINE.search(line)
+    if match is None:
+        return None, None
+    return match.lastgroup, match
+
+
+def transition_text(kind, match):
+    """
+    Get the label of a DFA or GTA transition line (such as "#1=0, #2=1").
+    """
+    return match.group("dfalabel") if kind == DFA_TRANS else match.group("gtalabel")
+
+
+def parse_time(match):
+    """
+    Get the time in seconds from a matched Time line.
+    """
+    return 3600*float(match.group("hours")) + 60*float(match.group("minutes")) + \
+        float(match.group("seconds"))
@@ -12,13 +12,31 @@ import subprocess
 import os
 import graphviz
 import math
-import socket
+import re
+import asyncio
+import functools
+import hashlib
+import collections
+import array
+import numpy
+import json
+
+import monaformula
+import freevars
 
 FORMULAS = 400
 MAX_LABEL = 2000
 CREATE_FILES = True
 
 SOCKET_NR = 50889
+JOBS = os.cpu_count()
+NATIVE = True
+CACHE_SIZE = 100000
+#Header of a batch (a file of this name is predicted as a file)
+BATCH = "batch "
+BATCH_HEADER = re.compile(r"batch ([0-9]+)")
+#Models fitted by fit-model.py, loaded at startup if the file exists
+MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "predict-model.json")
 
 PRED_CALL = "PredCall"
 SKIP_OP = ["Negate", "Restrict", PRED_CALL]
@@ -62,182 +80,808 @@ CALC_SIZES = {
     "PresbConst" : lambda x : 3 if x < 1 else 4 + int(math.log2(x))
 }
 
+#Linear models (slope, intercept) of the size of a binary operation applied
+#to the product of the sizes of its operands, by the number of shared variables
+#(of the logarithms of the sizes if LOG_SPACE is set)
 PREDICT = {
     "And" : [
-        lambda x : 1.02 * x - 0.20,
-        lambda x : 0.99 * x - 0.36,
-        lambda x : 0.91 * x - 0.25,
-        lambda x : 0.90 * x - 0.30,
-        lambda x : 0.87 * x - 0.51,
-        lambda x : 0.87 * x - 1.00,
-        lambda x : 0.86 * x - 1.28,
-        lambda x : 1.00 * x - 2.18,
-        lambda x : 1.00 * x - 2.23,
-        lambda x : 1.00 * x - 2.75,
-        lambda x : 1.00 * x - 3.03,
-        lambda x : 1.00 * x - 3.32,
+        (1.02, -0.20),
+        (0.99, -0.36),
+        (0.91, -0.25),
+        (0.90, -0.30),
+        (0.87, -0.51),
+        (0.87, -1.00),
+        (0.86, -1.28),
+        (1.00, -2.18),
+        (1.00, -2.23),
+        (1.00, -2.75),
+        (1.00, -3.03),
+        (1.00, -3.32),
     ],
     "Or" : [
-        lambda x : 1.07 * x - 0.32,
-        lambda x : 1.06 * x - 0.31,
-        lambda x : 0.93 * x - 0.28,
-        lambda x : 0.36 * x + 0.49,
-        lambda x : 0.05 * x + 1.29,
+        (1.07, -0.32),
+        (1.06, -0.31),
+        (0.93, -0.28),
+        (0.36, 0.49),
+        (0.05, 1.29),
     ],
     "Impl" : [
-        lambda x : 1.00 * x + 0.00,
-        lambda x : 0.89 * x - 0.21,
-        lambda x : 0.51 * x - 0.30,
-        lambda x : 0.95 * x - 1.13,
+        (1.00, 0.00),
+        (0.89, -0.21),
+        (0.51, -0.30),
+        (0.95, -1.13),
     ],
     "Biimpl" : [
-        lambda x : 1.08 * x - 0.32,
-        lambda x : 1.26 * x - 0.74,
-        lambda x : 0.13 * x + 0.73,
+        (1.08, -0.32),
+        (1.26, -0.74),
+        (0.13, 0.73),
     ]
 }
 
-MAX_SHARED = {k : len(PREDICT[k]) for k in PREDICT}
-
-class Formula:
-    _counter = 1
-    @staticmethod
-    def _skip_unused(formula):
-        while True:
-            if formula[-1] == ']':
-                formula, repls = formula[:-1].rsplit('[', 1)
-                repls
-                for repl in reversed(repls.split(',')):
-                    old, new = repl.split('->')
-                    formula = formula.replace(old, new)
-            oper, formula = formula[:-1].split('(', 1)
-            if oper == PRED_CALL:
-                formula = formula.split(',', 1)[1]
-                formula
-            if oper not in SKIP_OP:
-                return oper, formula
-    
-
-    @staticmethod
-    def _split_index(formula):
-        ind = 0
-        cnt = 0
-        while True:
-            if formula[ind] == ',' and cnt == 0:
-                break
-            if formula[ind] in ['(', '[']:
-                cnt += 1
-            if formula[ind] in [')', ']']:
-                cnt -= 1
-            ind += 1
-        return ind
-
-
-    def __init__(self, formula):
-        self.id = str(Formula._counter)
-        Formula._counter += 1
-        oper, formula = Formula._skip_unused(formula)
-
-        self.name = oper + "(" + formula + ")"
-        self.oper = oper
-
-        if self.oper in NULLARY_OP:
-            self.__init_nullary__(formula)
-        elif self.oper in UNARY_OP:
-            self.__init_unary__(formula)
+MAX_SHARED = {k : len(PREDICT[k]) - 1 for k in PREDICT}
+
+#Factors of the sizes of minimized automata
+UNARY_FACTOR = 0.81
+BINARY_FACTOR = 0.61
+#The models are fitted to logarithms of the sizes
+LOG_SPACE = False
+
+#Operation codes of the nodes of formula trees
+OPERS = NULLARY_OP + UNARY_OP + list(PREDICT)
+OPER_CODES = {oper : code for code, oper in enumerate(OPERS)}
+NONE = -1
+#Entry missing in a table (see Renaming)
+MISSING = object()
+
+
+def model_tables():
+    """
+    Get the models as arrays indexed by operation codes and numbers of shared
+    variables: slopes, intercepts and factors. A unary operation is the model
+    1 * x + 0 of the size x of its operand.
+    """
+    width = max(MAX_SHARED.values()) + 1
+    slopes = numpy.ones((len(OPERS), width))
+    intercepts = numpy.zeros((len(OPERS), width))
+    factors = numpy.ones(len(OPERS))
+    for oper in UNARY_OP:
+        factors[OPER_CODES[oper]] = UNARY_FACTOR
+    for oper, models in PREDICT.items():
+        for shared, (slope, intercept) in enumerate(models):
+            slopes[OPER_CODES[oper], shared] = slope
+            intercepts[OPER_CODES[oper], shared] = intercept
+        factors[OPER_CODES[oper]] = BINARY_FACTOR
+    return slopes, intercepts, factors
+
+
+SLOPES, INTERCEPTS, FACTORS = model_tables()
+
+
+def load_model(filename):
+    """
+    Replace the models by the ones in a file written by fit-model.py (sizes
+    of atoms can be given as const_sizes).
+    """
+    global MAX_SHARED, UNARY_FACTOR, BINARY_FACTOR, LOG_SPACE
+    global SLOPES, INTERCEPTS, FACTORS
+    with open(filename, "r") as handle:
+        model = json.load(handle)
+    for oper, models in model["predict"].items():
+        if oper not in PREDICT or not models:
+            raise ValueError("bad model of {0} in {1}".format(oper, filename))
+        PREDICT[oper] = [(slope, intercept) for slope, intercept in models]
+    CONST_SIZES.update(model.get("const_sizes", dict()))
+    UNARY_FACTOR = model.get("unary_factor", UNARY_FACTOR)
+    BINARY_FACTOR = model.get("binary_factor", BINARY_FACTOR)
+    LOG_SPACE = model.get("space", "linear") == "log"
+    MAX_SHARED = {k : len(PREDICT[k]) - 1 for k in PREDICT}
+    SLOPES, INTERCEPTS, FACTORS = model_tables()
+
+TOKEN = re.compile(r"->|[()\[\],]|(?:[^()\[\],\s-]|-(?!>))+")
+
+#Frames of the construction of a formula
+ENTER = 0
+EXIT = 1
+
+
+class PredictionCache:
+    """
+    LRU cache of predictions of subformulas. A subformula is keyed by the
+    hash of its text with variables renamed in the order of their first
+    occurrence, so subformulas equal up to renaming share an entry. An
+    entry holds size, total_size and fv (with variables given by the index
+    of their first occurrence).
+    """
+
+    __slots__ = ("bound", "entries", "hits", "misses")
+
+    def __init__(self, bound):
+        self.bound = bound
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.bound:
+            self.entries.popitem(last=False)
+
+
+    def stats(self):
+        return "hits {0} misses {1} entries {2}".format(self.hits, self.misses, len(self.entries))
+
+
+def predict_size(oper, left, right=None, shared=0):
+    """
+    Predict the size of the minimized automaton of an operation of OPERS on
+    automata of sizes left and right (None for Project) sharing the given
+    number of variables.
+    """
+    if right is None:
+        return max(1, int(left * UNARY_FACTOR))
+    slope, intercept = PREDICT[oper][min(shared, MAX_SHARED[oper])]
+    if LOG_SPACE:
+        size = math.exp(slope * math.log(left * right) + intercept)
+    else:
+        size = slope * (left * right) + intercept
+    return max(1, int(size * BINARY_FACTOR))
+
+
+def tokenize(formula):
+    return TOKEN.findall(formula)
+
+
+def parse_terms(tokens):
+    """
+    Split a formula line into terms oper(args)[substitution] in one pass.
+    Terms are numbered in preorder; a term is [oper, args, substitution,
+    start, end] where args are numbers of subterms or tokens, the
+    substitution is a list of pairs (old, new) and start:end are the tokens
+    of oper(args).
+    """
+    terms = list()
+    stack = list()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if i + 1 < len(tokens) and tokens[i + 1] == '(':
+            if stack:
+                terms[stack[-1]][1].append(len(terms))
+            stack.append(len(terms))
+            terms.append([token, list(), list(), i, None])
+            i += 2
+        elif token == ')':
+            term = terms[stack.pop()]
+            i += 1
+            term[4] = i
+            if i < len(tokens) and tokens[i] == '[':
+                i += 1
+                while tokens[i] != ']':
+                    term[2].append((tokens[i], tokens[i + 2]))
+                    i += 3
+                    if tokens[i] == ',':
+                        i += 1
+                i += 1
         else:
-            ind = Formula._split_index(formula)
-            self.__init_binary__(formula[:ind], formula[ind + 1:])
-  
-
-    def __init_nullary__(self, formula):
-        self.right = None
-        self.left = None
-        if self.oper in CONST_SIZES:
-            self.size = CONST_SIZES[self.oper]
-            self.fv = set(formula.split(','))
+            if token != ',':
+                terms[stack[-1]][1].append(token)
+            i += 1
+    return terms
+
+
+def substitute(substs, var):
+    """
+    Get the variable var is renamed to by a list of substitutions from the
+    outermost one. The pairs of a substitution are applied from the last
+    one, as MONA prints them.
+    """
+    for subst in substs:
+        for old, new in reversed(subst):
+            if var == old:
+                var = new
+    return var
+
+
+def env_substs(env):
+    """
+    Get the substitutions of an environment, a linked list (outer
+    environment, substitution) from the innermost substitution (None if
+    there is none), from the outermost one.
+    """
+    substs = list()
+    while env is not None:
+        env, subst = env
+        substs.append(subst)
+    substs.reverse()
+    return substs
+
+
+class Renaming:
+    """
+    Renaming of variables by the substitutions of the environment of a term
+    while the tree is built depth first. Variables renamed to the same one
+    are classes of a union-find labelled by the name they are renamed to, so
+    that a lookup and a pair of a substitution cost O(log n) regardless of
+    the depth of the environment. Changes are logged and undone once the
+    subtree of the substitution is built.
+    """
+
+    __slots__ = ("parents", "sizes", "labels", "owners", "log")
+
+    def __init__(self):
+        self.parents = dict()
+        self.sizes = dict()
+        #Names of the roots of the classes and the roots by their names
+        self.labels = dict()
+        self.owners = dict()
+        self.log = list()
+
+
+    def get(self, var):
+        if var not in self.parents:
+            return var
+        while self.parents[var] != var:
+            var = self.parents[var]
+        return self.labels[var]
+
+
+    def owner(self, name):
+        """
+        Get the root of the class renamed to name (None if there is none). A
+        variable not seen yet is a class of its own (which is never undone).
+        """
+        if name not in self.parents:
+            self.parents[name] = name
+            self.sizes[name] = 1
+            self.labels[name] = name
+            self.owners[name] = name
+        return self.owners.get(name)
+
+
+    def rename(self, old, new):
+        src = self.owner(old)
+        if src is None or old == new:
+            return
+        dst = self.owner(new)
+        self._set(self.owners, old, MISSING)
+        if dst is None:
+            self._set(self.labels, src, new)
+            self._set(self.owners, new, src)
+            return
+        #The smaller class is merged into the larger one
+        if self.sizes[src] > self.sizes[dst]:
+            src, dst = dst, src
+        self._set(self.parents, src, dst)
+        self._set(self.sizes, dst, self.sizes[src] + self.sizes[dst])
+        self._set(self.labels, dst, new)
+        self._set(self.owners, new, dst)
+
+
+    def _set(self, table, key, value):
+        self.log.append((table, key, table.get(key, MISSING)))
+        if value is MISSING:
+            del table[key]
         else:
-            n = int(formula.split(',')[-1])
-            self.fv = set(formula.split(',')[:-1])
-            self.size = CALC_SIZES[self.oper](n)
-        self.total_size = self.size
-
-
-    def __init_unary__(self, formula):
-        self.var, formula = formula.split(',', 1)
-        self.left = Formula(formula)
-        self.right = None
-        self.fv = self.left._get_fv()
-        self.fv.discard(self.var)
-        self.size = max(1, int(self.left.size * 0.81))
-        self.total_size = self.size + self.left.total_size
-    
+            table[key] = value
+
+
+    def mark(self):
+        return len(self.log)
+
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            table, key, value = self.log.pop()
+            if value is MISSING:
+                del table[key]
+            else:
+                table[key] = value
+
+
+def extend(env, subst, renaming):
+    """
+    Extend the environment by the substitution of a term and apply it to
+    the renaming of env. Variables of an inner substitution are renamed by
+    the outer ones.
+    """
+    if not subst:
+        return env
+    subst = tuple((renaming.get(old), renaming.get(new)) for old, new in subst)
+    for old, new in reversed(subst):
+        renaming.rename(old, new)
+    return env, subst
+
+
+def occurrence(index, names, var):
+    if var not in index:
+        index[var] = len(names)
+        names.append(var)
+    return index[var]
+
+
+def rename_key(key, names, rename):
+    """
+    Get the key of a term renamed by the function rename and its renamed
+    variables. The key changes only if the renaming merges some variables.
+    """
+    index = dict()
+    renamed = list()
+    pattern = tuple(occurrence(index, renamed, rename(var)) for var in names)
+    if len(renamed) == len(names):
+        return key, renamed
+    return hashlib.blake2b(repr((key, pattern)).encode(), digest_size=16).digest(), renamed
+
+
+def term_keys(terms):
+    """
+    Get the keys of the terms (without their own substitution) invariant
+    under renaming of variables, and the variables of the terms in the order
+    of their first occurrence. Subterms have higher numbers than their
+    parents, so the terms are processed from the last one.
+    """
+    keys = [None]*len(terms)
+    full = [None]*len(terms)
+    for term in reversed(range(len(terms))):
+        oper, args, subst, _, _ = terms[term]
+        index = dict()
+        names = list()
+        signature = [oper]
+        for arg in args:
+            if isinstance(arg, int):
+                key, arg_names = full[arg]
+                signature.append((key, tuple(occurrence(index, names, var) for var in arg_names)))
+            elif arg.startswith('#'):
+                signature.append(occurrence(index, names, arg))
+            else:
+                signature.append(arg)
+        key = hashlib.blake2b(repr(signature).encode(), digest_size=16).digest()
+        keys[term] = key, names
+        full[term] = subst_key(key, names, index, subst)
+    return keys
+
+
+def subst_key(key, names, index, subst):
+    """
+    Get the key of a term with its own substitution and the variables of
+    both. Outer substitutions rename the variables of the substitution as
+    well (they may merge a variable with the one it replaces), so the
+    substitution is a part of the key instead of being applied to it.
+    """
+    if not subst:
+        return key, names
+    index = dict(index)
+    names = list(names)
+    pairs = tuple((occurrence(index, names, old), occurrence(index, names, new)) for old, new in subst)
+    return hashlib.blake2b(repr((key, pairs)).encode(), digest_size=16).digest(), names
+
+
+def skip_unused(terms, term, env, renaming):
+    while terms[term][0] in SKIP_OP:
+        env = extend(env, terms[term][2], renaming)
+        args = terms[term][1]
+        term = args[1] if terms[term][0] == PRED_CALL else args[0]
+    return term, extend(env, terms[term][2], renaming)
 
-    def __init_binary__(self, lformula, rformula):
-        self.left = Formula(lformula)
-        self.right = Formula(rformula)
-        self.fv = self.left._get_fv().union(self.right._get_fv())
-        shared_vars = len(self.left.fv) + len(self.right.fv) - len(self.fv)
-        shared_vars = min(shared_vars, MAX_SHARED[self.oper])
-        self.size = PREDICT[self.oper][shared_vars](self.left.size * self.right.size)
-        self.size = max(1, int(self.size * 0.61))
-        self.total_size = self.size + self.left.total_size + self.right.total_size
 
-
-    def _get_fv(self):
-        return self.fv.copy()
+class Formula:
+    """
+    Tree of a formula with predicted sizes, stored as arrays indexed by the
+    nodes in preorder (the root is 0): operation codes, children (NONE if
+    there is no child), the projected variable of Project nodes, the number
+    of variables shared by the children (capped by MAX_SHARED), the height,
+    sizes and total sizes. Variables are interned to dense ids of the tree
+    and free variables are bitsets of these ids. Names of the nodes are
+    rendered from the tokens of the formula line only when they are needed.
+    """
+
+    __slots__ = ("opers", "lefts", "rights", "bound", "shared", "heights", "sizes",
+                 "totals", "fvs", "vars", "tokens", "starts", "ends", "envs", "pending")
+
+    def __init__(self, formula, cache=None, evaluate=True):
+        """
+        Build the tree of a formula line of mona -a. The line is tokenized
+        once and the tree is built with an explicit stack, so the time is
+        linear in the length of the line (up to the union-find of
+        Renaming) and the depth is not limited by recursion. If evaluate is False, sizes of inner nodes are left to
+        predict_batch.
+        """
+        self.opers = array.array("B")
+        self.lefts = array.array("i")
+        self.rights = array.array("i")
+        self.bound = array.array("i")
+        self.shared = array.array("B")
+        self.heights = array.array("i")
+        self.sizes = list()
+        self.totals = list()
+        self.fvs = list()
+        self.vars = freevars.VarTable()
+        self.tokens = tokenize(formula)
+        self.starts = array.array("i")
+        self.ends = array.array("i")
+        self.envs = list()
+        #Nodes to be put to the cache once they are evaluated
+        self.pending = list()
+
+        terms = parse_terms(self.tokens)
+        keys = term_keys(terms) if cache is not None else None
+
+        #Nodes keep their environments to render their names, the tree is
+        #built with the renaming of the environment of the current node
+        renaming = Renaming()
+        stack = [(ENTER, 0, None, NONE, None)]
+        while stack:
+            frame = stack.pop()
+            if frame[0] == EXIT:
+                _, node, key, names, mark = frame
+                renaming.undo(mark)
+                self._init_inner(node)
+                if evaluate:
+                    self._init_size(node)
+                    self._put(node, cache, key, names)
+                elif cache is not None:
+                    self.pending.append((node, key, names))
+                continue
+
+            _, term, env, parent, children = frame
+            mark = renaming.mark()
+            term, env = skip_unused(terms, term, env, renaming)
+            node = self._add_node(terms[term], env)
+            if parent != NONE:
+                children[parent] = node
+
+            key = names = None
+            if cache is not None:
+                key, names = rename_key(keys[term][0], keys[term][1], renaming.get)
+                entry = cache.get(key)
+                if entry is not None:
+                    #Subtrees of cached formulas are not built
+                    self._init_cached(node, entry, names)
+                    renaming.undo(mark)
+                    continue
+
+            oper, args = terms[term][0], terms[term][1]
+            if oper in NULLARY_OP:
+                self._init_nullary(node, [renaming.get(arg) for arg in args])
+                self._put(node, cache, key, names)
+                renaming.undo(mark)
+            elif oper in UNARY_OP:
+                self.bound[node] = self.vars.intern(renaming.get(args[0]))
+                stack.append((EXIT, node, key, names, mark))
+                stack.append((ENTER, args[1], env, node, self.lefts))
+            else:
+                #The right child is set before the node is finished
+                stack.append((EXIT, node, key, names, mark))
+                stack.append((ENTER, args[1], env, node, self.rights))
+                stack.append((ENTER, args[0], env, node, self.lefts))
+
+
+    @property
+    def size(self):
+        return self.sizes[0]
+
+
+    @property
+    def total_size(self):
+        return self.totals[0]
+
+
+    @property
+    def fv(self):
+        return self.free_vars(0)
+
+
+    def free_vars(self, node):
+        return set(self.vars.names(self.fvs[node]))
+
+
+    def name(self, node):
+        substs = env_substs(self.envs[node])
+        tokens = self.tokens[self.starts[node]:self.ends[node]]
+        renamed = {token: substitute(substs, token) for token in set(tokens)}
+        return "".join(renamed[token] for token in tokens)
+
+
+    def _add_node(self, term, env):
+        self.opers.append(OPER_CODES[term[0]])
+        self.lefts.append(NONE)
+        self.rights.append(NONE)
+        self.bound.append(NONE)
+        self.shared.append(0)
+        self.heights.append(0)
+        self.sizes.append(0)
+        self.totals.append(0)
+        self.fvs.append(0)
+        self.starts.append(term[3])
+        self.ends.append(term[4])
+        self.envs.append(env)
+        return len(self.opers) - 1
+
+
+    def _init_cached(self, node, entry, names):
+        self.sizes[node], self.totals[node] = entry[0], entry[1]
+        bits = 0
+        for var in entry[2]:
+            bits |= self.vars.bit(names[var] if isinstance(var, int) else var)
+        self.fvs[node] = bits
+
+
+    def _put(self, node, cache, key, names):
+        if cache is not None:
+            index = {name: i for i, name in enumerate(names)}
+            fv = tuple(index.get(var, var) for var in self.free_vars(node))
+            cache.put(key, (self.sizes[node], self.totals[node], fv))
+
+
+    def _init_nullary(self, node, args):
+        oper = OPERS[self.opers[node]]
+        if not args:
+            args = ['']
+        if oper in CONST_SIZES:
+            self.sizes[node] = CONST_SIZES[oper]
+        else:
+            self.sizes[node] = CALC_SIZES[oper](int(args[-1]))
+            args = args[:-1]
+        #An empty argument list counts as the variable '' (as the sizes were fitted)
+        bits = 0
+        for var in args:
+            bits |= self.vars.bit(var)
+        self.fvs[node] = bits
+        self.totals[node] = self.sizes[node]
+
+
+    def _init_inner(self, node):
+        """
+        Set the free variables, shared variables and height of an inner node.
+        """
+        left, right = self.lefts[node], self.rights[node]
+        if right == NONE:
+            self.fvs[node] = self.fvs[left] & ~(1 << self.bound[node])
+            self.heights[node] = self.heights[left] + 1
+            return
+        oper = OPERS[self.opers[node]]
+        self.fvs[node] = self.fvs[left] | self.fvs[right]
+        shared_vars = freevars.shared(self.fvs[left], self.fvs[right])
+        self.shared[node] = min(shared_vars, MAX_SHARED[oper])
+        self.heights[node] = max(self.heights[left], self.heights[right]) + 1
+
+
+    def _init_size(self, node):
+        left, right = self.lefts[node], self.rights[node]
+        if right == NONE:
+            self.sizes[node] = predict_size(UNARY_OP[0], self.sizes[left])
+            self.totals[node] = self.sizes[node] + self.totals[left]
+            return
+        self.sizes[node] = predict_size(OPERS[self.opers[node]], self.sizes[left],
+                                        self.sizes[right], self.shared[node])
+        self.totals[node] = self.sizes[node] + self.totals[left] + self.totals[right]
+
+
+    def _init_totals(self):
+        #Children have higher numbers than their parents
+        for node in reversed(range(len(self.opers))):
+            left, right = self.lefts[node], self.rights[node]
+            if left != NONE:
+                self.totals[node] = self.sizes[node] + self.totals[left] + \
+                    (self.totals[right] if right != NONE else 0)
 
 
     def to_graph(self, name):
         graph = graphviz.Digraph(name)
-        self._to_graph(graph)
+        #Children are added before their parent
+        stack = [(0, False)]
+        while stack:
+            node, expanded = stack.pop()
+            left, right = self.lefts[node], self.rights[node]
+            if left != NONE and not expanded:
+                stack.append((node, True))
+                if right != NONE:
+                    stack.append((right, False))
+                stack.append((left, False))
+                continue
+            oper = OPERS[self.opers[node]]
+            size = str(self.sizes[node])
+            fv = self.free_vars(node)
+            if left == NONE:
+                create_leaf_node(graph, str(node), self.name(node), size, fv)
+            elif right == NONE:
+                create_unary_node(graph, str(node), self.name(node), size, fv, str(left), oper)
+            else:
+                create_binary_node(graph, str(node), self.name(node), size, fv, str(left),
+                                   str(right), oper)
         return graph
 
 
-    def _to_graph(self, graph):
-        if self.left is None:
-            create_leaf_node(graph, self.id, self.name, str(self.size), self.fv)
-        elif self.right is None:
-            self.left._to_graph(graph)
-            create_unary_node(graph, self.id, self.name, str(self.size), self.fv,
-                              self.left.id, self.oper)
+def predict_batch(formulas, cache=None):
+    """
+    Evaluate the sizes of formulas built with evaluate=False at once. Nodes
+    of all trees are merged into arrays and evaluated level by level from
+    the leaves, each level by a few vector operations over all its nodes.
+    Sizes are computed in floating point as by Formula, so the predictions
+    are the same (up to rounding of log and exp of models in log space);
+    total sizes are summed as ints. Return the total sizes.
+    """
+    if not formulas:
+        return list()
+    counts = [len(formula.opers) for formula in formulas]
+    offsets = numpy.cumsum([0] + counts)
+    #The last node is a sentinel standing for a missing child
+    sentinel = int(offsets[-1])
+
+    opers = numpy.concatenate([numpy.frombuffer(f.opers, dtype=numpy.uint8) for f in formulas])
+    shared = numpy.concatenate([numpy.frombuffer(f.shared, dtype=numpy.uint8) for f in formulas])
+    heights = numpy.concatenate([numpy.frombuffer(f.heights, dtype=numpy.intc) for f in formulas])
+    lefts = numpy.concatenate([children(f.lefts, offset, sentinel) for f, offset in zip(formulas, offsets)])
+    rights = numpy.concatenate([children(f.rights, offset, sentinel) for f, offset in zip(formulas, offsets)])
+    sizes = numpy.array([size for f in formulas for size in f.sizes] + [1], dtype=numpy.float64)
+
+    order = numpy.argsort(heights, kind="stable")
+    bounds = numpy.searchsorted(heights[order], numpy.arange(int(heights.max(initial=0)) + 2))
+    for height in range(1, len(bounds) - 1):
+        nodes = order[bounds[height]:bounds[height + 1]]
+        codes, buckets = opers[nodes], shared[nodes]
+        product = sizes[lefts[nodes]] * sizes[rights[nodes]]
+        if LOG_SPACE:
+            size = numpy.exp(SLOPES[codes, buckets] * numpy.log(product) + INTERCEPTS[codes, buckets])
+            size = numpy.where(rights[nodes] == sentinel, product, size)
         else:
-            self.left._to_graph(graph)
-            self.right._to_graph(graph)
-            create_binary_node(graph, self.id, self.name, str(self.size), self.fv,
-                               self.left.id, self.right.id, self.oper)
+            size = SLOPES[codes, buckets] * product + INTERCEPTS[codes, buckets]
+        sizes[nodes] = numpy.maximum(1, numpy.trunc(size * FACTORS[codes]))
 
+    results = list()
+    for formula, offset, count in zip(formulas, offsets, counts):
+        formula.sizes = [int(size) for size in sizes[offset:offset + count].tolist()]
+        formula._init_totals()
+        for node, key, names in formula.pending:
+            formula._put(node, cache, key, names)
+        formula.pending = list()
+        results.append(formula.total_size)
+    return results
+
+
+def children(nodes, offset, sentinel):
+    nodes = numpy.frombuffer(nodes, dtype=numpy.intc).astype(numpy.int64)
+    return numpy.where(nodes == NONE, sentinel, nodes + offset)
 
-def main():
-    global SOCKET_NR
 
-    monabin = parse_args(sys.argv)
+def predict_lines(lines, cache=None):
+    """
+    Get the total sizes of formula lines of mona -a, evaluated in one batch.
+    """
+    return predict_batch([Formula(line, cache, evaluate=False) for line in lines], cache)
 
-    socket_in = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socket_in.bind(('localhost', SOCKET_NR))
-    socket_in.listen()
-    while True:
-        conn, _ = socket_in.accept()
-        monafile = conn.recv(2048).decode()
 
-        if monafile == "stop":
-            break
+def main():
+    global SOCKET_NR
 
-        try:
-            mona_output = process_file(monafile, monabin)      
-            formula = Formula(mona_output.split('\n')[-1])
-            data = str(formula.total_size).encode()
-            conn.sendall(data)
-            # print("{0}".format(formula.total_size))
-        except subprocess.CalledProcessError as _:
-            conn.sendall("ERROR".encode())
+    monabin, jobs, cache_size, model = parse_args(sys.argv)
+    if model is not None:
+        load_model(model)
+    #The default model file is picked up silently otherwise
+    sys.stderr.write("Model: {0}\n".format("built-in" if model is None else os.path.abspath(model)))
+    cache = PredictionCache(cache_size) if cache_size > 0 else None
+    asyncio.run(serve(monabin, jobs, cache))
+
+
+async def serve(monabin, jobs, cache):
+    """
+    Serve predictions until a client sends stop. Every connection is handled
+    concurrently; at most jobs MONA processes run at once.
+    """
+    limit = asyncio.Semaphore(jobs)
+    stop = asyncio.Event()
+    handler = functools.partial(handle_client, monabin, limit, cache, stop)
+    server = await asyncio.start_server(handler, 'localhost', SOCKET_NR)
+    async with server:
+        await stop.wait()
+
+
+async def handle_client(monabin, limit, cache, stop, reader, writer):
+    """
+    Messages are lines: the client sends the names of MONA files (or stop),
+    one per line, and gets one line with the predicted size (or ERROR) for
+    each of them. The message batch N followed by N names gets N lines with
+    the sizes predicted in one batch (a malformed count gets ERROR). The
+    message stats gets the statistics of the cache.
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            monafile = line.decode().rstrip("\n")
+            if monafile == "stop":
+                stop.set()
+                break
+            if monafile == "stats":
+                response = "no cache" if cache is None else cache.stats()
+            elif monafile.startswith(BATCH) and not os.path.isfile(monafile):
+                header = BATCH_HEADER.fullmatch(monafile)
+                if header is None:
+                    response = "ERROR"
+                else:
+                    monafiles = list()
+                    for _ in range(int(header.group(1))):
+                        monafiles.append((await reader.readline()).decode().rstrip("\n"))
+                    if not monafiles:
+                        continue
+                    response = "\n".join(await predict_files(monafiles, monabin, limit, cache))
+            else:
+                response = await predict_file(monafile, monabin, limit, cache)
+            writer.write(response.encode() + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def predict_file(monafile, monabin, limit, cache):
+    line = await monafile_line(monafile, monabin, limit)
+    if line is None:
+        return "ERROR"
+    formula = Formula(line, cache)
+    return str(formula.total_size)
+
+
+async def predict_files(monafiles, monabin, limit, cache):
+    """
+    Predict the sizes of the files in one batch (lines of MONA are obtained
+    concurrently).
+    """
+    lines = await asyncio.gather(*[monafile_line(monafile, monabin, limit) \
+        for monafile in monafiles])
+    sizes = iter(predict_lines([line for line in lines if line is not None], cache))
+    return ["ERROR" if line is None else str(next(sizes)) for line in lines]
+
+
+async def monafile_line(monafile, monabin, limit):
+    """
+    Get the formula line of a file (None if MONA fails).
+    """
+    try:
+        line = native_formula(monafile)
+        if line is None:
+            mona_output = await process_file_async(monafile, monabin, limit)
+            line = mona_output.split('\n')[-1]
+    except subprocess.CalledProcessError as _:
+        return None
+    return line
 
 
 def parse_args(args):
-    if len(sys.argv) != 2:
+    global NATIVE
+    if len(args) < 2:
+        help_err()
+        sys.exit()
+    try:
+        opts, _ = getopt.getopt(args[2:], "j:m:", ["jobs=", "mona-only", "cache-size=", "model="])
+    except getopt.GetoptError as _:
         help_err()
         sys.exit()
-    return args[1]
+
+    jobs = JOBS
+    cache_size = CACHE_SIZE
+    model = MODEL if os.path.isfile(MODEL) else None
+    for o, a in opts:
+        if o in ("-j", "--jobs"):
+            jobs = int(a)
+        if o == "--mona-only":
+            NATIVE = False
+        if o == "--cache-size":
+            cache_size = int(a)
+        if o in ("-m", "--model"):
+            model = a
+    return args[1], jobs, cache_size, model
 
 
 def get_files(formulafolder):
@@ -249,10 +893,40 @@ def get_files(formulafolder):
     return files[:FORMULAS]
 
 
+def native_formula(filename):
+    """
+    Get the formula line without running MONA (None if the file is out of
+    the subset supported by monaformula).
+    """
+    if not NATIVE:
+        return None
+    try:
+        return monaformula.parse_file(filename)
+    except (monaformula.UnsupportedFormula, IOError) as _:
+        return None
+
+
+def formula_line(filename, monabin):
+    line = native_formula(filename)
+    if line is None:
+        line = process_file(filename, monabin).split('\n')[-1]
+    return line
+
+
 def process_file(filename, monabin):
     return subprocess.check_output([monabin, "-a", filename]).decode("utf-8")
 
 
+async def process_file_async(filename, monabin, limit):
+    async with limit:
+        proc = await asyncio.create_subprocess_exec(monabin, "-a", filename, \
+            stdout=subprocess.PIPE)
+        output, _ = await proc.communicate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, [monabin, "-a", filename], output)
+    return output.decode("utf-8")
+
+
 def print_graph(filename, folder, suf, formula):
     base = os.path.basename(filename)
     name = os.path.splitext(base)[0]
@@ -291,7 +965,7 @@ def print_config():
 
 def help_err():
     sys.stderr.write("Bad input arguments. \nFormat: ./predict.py " +
-                     "[mona-bin]\n")
+                     "[mona-bin] [--jobs=X] [--mona-only] [--cache-size=X] [--model=FILE]\n")
 
 
 if __name__ == "__main__":
@@ -7,7 +7,17 @@
 """
 
 import sys
+import getopt
 import os
+import json
+import hashlib
+
+import numpy
+
+import freevars
+import columns
+import runner
+import events
 
 BIN_OPERATIONS = {
     '&': 'and',
@@ -20,74 +30,222 @@ UN_OPERATIONS = {
     'proj': 'proj',
 }
 
+OPERATIONS = list(BIN_OPERATIONS) + list(UN_OPERATIONS)
+HEADER = 'size1;fvcnt1;size2;fvcnt2;cmnfvcnt;size;minsize'
+
+#CPUs this process may run on (the affinity mask, not all CPUs of the machine)
+JOBS = len(runner.available_cpus())
+#Number of files aggregated by a task of the pool
+CHUNK = 16
+
+#Rows contributed by the files processed so far, kept next to the results
+MANIFEST = "process-results.manifest.json"
+MANIFEST_VERSION = 1
+
+VARS = freevars.VarTable()
+#Operations of the rows by the names of operations in the files
+ROUTES = dict()
+
 
 def main():
-    if len(sys.argv) != 2:
+    global JOBS
+    if len(sys.argv) < 2:
         help_err()
         sys.exit()
 
+    try:
+        opts, _ = getopt.getopt(sys.argv[2:], "j:m:f", ["jobs=", "manifest=", "full", "events="])
+    except getopt.GetoptError as _:
+        help_err()
+        sys.exit()
+
+    manifest = MANIFEST
+    full = False
+    for o, a in opts:
+        if o in ("-j", "--jobs"):
+            JOBS = int(a)
+        if o in ("-m", "--manifest"):
+            manifest = a
+        if o in ("-f", "--full"):
+            full = True
+        if o == "--events":
+            events.set_target(a)
+
     files = get_files(sys.argv[1])
-    process_files(files)
+    entries = dict() if full else load_manifest(manifest)
+    entries = update_entries(files, entries)
+    save_results(merge_results(files, entries))
+    write_atomic(manifest, json.dumps({"version": MANIFEST_VERSION, "files": entries}))
 
 
 def get_files(folder):
     files = [os.path.join(folder, f) for f in os.listdir(folder) \
         if os.path.isfile(os.path.join(folder, f)) and \
-            f.endswith(".csv")]
+            (f.endswith(".csv") or f.endswith(columns.EXTENSION))]
     return sorted(files)
 
 
+def load_manifest(manifest):
+    """
+    Get the entries of the manifest by the absolute paths of the files: the
+    mtime, size and hash of the file and its rows (none if there is no
+    manifest of this version).
+    """
+    try:
+        with open(manifest, "r") as handle:
+            data = json.load(handle)
+    except (IOError, ValueError):
+        return dict()
+    if data.get("version") != MANIFEST_VERSION:
+        return dict()
+    return data["files"]
+
+
+def update_entries(files, entries):
+    """
+    Get the entries of the files: entries of unchanged files are kept (a file
+    with a new mtime or size is unchanged if its hash is the same), the
+    other files are processed. Entries of deleted files are dropped.
+    """
+    updated = dict()
+    pending = list()
+    for filename in files:
+        path = os.path.abspath(filename)
+        stat = os.stat(filename)
+        entry = entries.get(path)
+        if entry is not None and (entry["mtime"], entry["size"]) != (stat.st_mtime_ns, stat.st_size):
+            if entry["hash"] == file_hash(filename):
+                entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            else:
+                entry = None
+        if entry is None:
+            pending.append(filename)
+        else:
+            updated[path] = entry
+    for filename, rows in process_files(pending).items():
+        stat = os.stat(filename)
+        updated[os.path.abspath(filename)] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, \
+            "hash": file_hash(filename), "rows": rows}
+    print("Files: {0}, processed: {1}, reused: {2}, dropped: {3}".format(len(files), len(pending), \
+        len(files) - len(pending), len(set(entries) - set(updated))))
+    return updated
+
+
+def file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
 def process_files(files):
-    results = dict()
-    for csv in files:
-        with open(csv, 'r') as handle:
-            process_file([line[:-1].split(';') for line in handle.readlines()], results)
-    save_results(results)
-    
+    """
+    Aggregate the files in tasks of CHUNK files run by JOBS processes. Get
+    the rows of every file.
+    """
+    chunks = [files[i:i + CHUNK] for i in range(0, len(files), CHUNK)]
+    rows = dict()
+    for _, partial in runner.run_tasks([(process_chunk, (chunk,)) for chunk in chunks], JOBS):
+        rows.update(partial)
+    return rows
+
+
+def merge_results(files, entries):
+    #Rows are merged in the order of the files, independently of the tasks
+    results = empty_results()
+    for filename in files:
+        rows = entries[os.path.abspath(filename)]["rows"]
+        for operation in OPERATIONS:
+            results[operation] += rows[operation]
+    return results
+
+
+def empty_results():
+    return {operation: list() for operation in OPERATIONS}
+
+
+def process_chunk(files):
+    rows = dict()
+    for filename in files:
+        rows[filename] = empty_results()
+        if filename.endswith(columns.EXTENSION):
+            process_records(columns.Records(filename), rows[filename])
+        else:
+            with open(filename, 'r') as handle:
+                process_file(handle, rows[filename])
+    return rows
+
+
+def route(name):
+    """
+    Get the operation of a row by the name of its operation (None if the row
+    is not aggregated).
+    """
+    if name not in ROUTES:
+        ROUTES[name] = next((op for op in OPERATIONS if name.startswith(op)), None)
+    return ROUTES[name]
 
 
 def process_file(lines, results):
-    global BIN_OPERATIONS
-    global UN_OPERATIONS
-    for operation in BIN_OPERATIONS:
-        data = [line for line in lines if line[0].startswith(operation)]
-        results[operation] = results.get(operation, default_bin()) +\
-            [format_bin_operation(line[1:]) for line in data]
-    for operation in UN_OPERATIONS:
-        data = [line for line in lines if line[0].startswith(operation)]
-        results[operation] = results.get(operation, default_bin()) +\
-            [format_bin_operation(line[1:]) for line in data]
+    """
+    Route the rows of a CSV file of mona-stat.py given as an iterable of
+    lines to the rows of their operations in a single pass.
+    """
+    for line in lines:
+        operation = route(line[:line.find(';')])
+        if operation is not None:
+            results[operation].append(format_bin_operation(line.rstrip('\n').split(';')[1:]))
     return results
 
 
-def format_bin_operation(line):
-    fv1 = set(line[2].split(','))
-    fv2 = set(line[5].split(','))
-    fv1.discard('')
-    fv2.discard('')
-    common = fv1.intersection(fv2)
-    return [line[1], str(len(fv1)), line[4], str(len(fv2)), str(len(common)), line[7], line[10]]
+def process_records(records, results):
+    """
+    Process the columns of a file of mona-stat.py. Operations and free
+    variables are looked up once per distinct value of their tables.
+    """
+    routes = [route(name) for name in records.table("operation")]
+    codes = records.column("operation")
+    fv1 = [VARS.list_bits(fv) for fv in records.table("fv1")]
+    fv2 = [VARS.list_bits(fv) for fv in records.table("fv2")]
+    for operation in OPERATIONS:
+        selected = [code for code, routed in enumerate(routes) if routed == operation]
+        rows = numpy.nonzero(numpy.isin(codes, selected))[0]
+        data = zip(records.column("size1")[rows].tolist(), records.column("fv1")[rows].tolist(), \
+            records.column("size2")[rows].tolist(), records.column("fv2")[rows].tolist(), \
+            records.column("resultsize")[rows].tolist(), records.column("minsize")[rows].tolist())
+        results[operation] += [';'.join([str(size1), str(freevars.popcount(fv1[code1])), \
+            str(size2), str(freevars.popcount(fv2[code2])), str(freevars.shared(fv1[code1], \
+            fv2[code2])), str(size), str(minsize)]) for size1, code1, size2, code2, size, minsize in data]
+    return results
 
 
-def default_bin():
-    return [['size1', 'fvcnt1', 'size2', 'fvcnt2', 'cmnfvcnt', 'size', 'minsize']]
+def format_bin_operation(line):
+    fv1 = VARS.list_bits(line[2])
+    fv2 = VARS.list_bits(line[5])
+    return ';'.join([line[1], str(freevars.popcount(fv1)), line[4], str(freevars.popcount(fv2)), \
+        str(freevars.shared(fv1, fv2)), line[7], line[10]])
 
 
 def save_results(results):
     global BIN_OPERATIONS
     global UN_OPERATIONS
-    for operation in BIN_OPERATIONS:
-        with open(BIN_OPERATIONS[operation] + '.csv', 'w') as handle:
-            text = '\n'.join([';'.join(result) for result in results[operation]]) + '\n'
-            handle.write(text)
-    for operation in UN_OPERATIONS:
-        with open(UN_OPERATIONS[operation] + '.csv', 'w') as handle:
-            text = '\n'.join([';'.join(result) for result in results[operation]]) + '\n'
-            handle.write(text)
+    names = dict(BIN_OPERATIONS, **UN_OPERATIONS)
+    for operation in OPERATIONS:
+        write_atomic(names[operation] + '.csv', '\n'.join([HEADER] + results[operation]) + '\n')
+
+
+def write_atomic(filename, text):
+    #Readers see either the old or the new file, never a partial one
+    tmp = "{0}.{1}.tmp".format(filename, os.getpid())
+    with open(tmp, "w") as handle:
+        handle.write(text)
+    os.replace(tmp, filename)
 
 
 def help_err():
-    sys.stderr.write("Bad input arguments. \nFormat: ./process-results.py [results folder]\n")
+    sys.stderr.write("Bad input arguments. \nFormat: ./process-results.py [results folder] [--jobs=X] " +
+                     "[--manifest=FILE] [--full] [--events=FILE|tcp:HOST:PORT]\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+ Regression checks of the trace parser and the predictor on small inputs
+ of bugs found so far. Prints the checks and fails on the first broken one.
+ @title regression.py
+"""
+
+import sys
+import importlib
+
+import predict
+
+monastat = importlib.import_module("mona-stat")
+
+#A ws1s automaton as printed by mona -i (the header lines come before the transitions)
+WS1S_TRACE = """MONA v1.4-18 for WS1S/WS2S
+Symbol table:
+Name      Id
+-----------------
+x         #1
+y         #2
+
+AUTOMATON CONSTRUCTION
+Less1(#1,#2)
+Automaton (3,5,1a)
+Resulting DFA:
+Initial state: 0
+Accepting states: 2
+Rejecting states: 0 1
+Automaton has 3 states and 5 BDD-nodes
+Transitions:
+State 0: #1=0, #2=0 -> state 1
+State 1: #1=1 -> state 2
+State 2:  -> state 2
+
+Formula is valid
+"""
+#Equal up to renaming but for the outer substitution, which merges #2 with the #1 replaced inside
+CACHE_COLLISION = ["Project(#9,Sub2(#1,#2)[#1->#3])", "Project(#9,Sub2(#1,#2)[#1->#3])[#2->#1]"]
+
+
+def main():
+    if len(sys.argv) > 1:
+        help_err()
+        sys.exit()
+
+    for check in CHECKS:
+        check()
+        print("{0}: OK".format(check.__name__))
+
+
+def check_ws1s_fv():
+    #Free variables of a DFA are read from the transitions after the "Automaton has" line
+    records = list(monastat.parse_mona(WS1S_TRACE.splitlines(True), dict()))
+    assert len(records) == 1, records
+    assert records[0][0] == "init" and records[0][7] == "1a", records
+    assert records[0][9] == "x,y", records
+
+
+def check_cache_collision():
+    #A formula predicted after a cached one gets the free variables it gets without the cache
+    cache = predict.PredictionCache(predict.CACHE_SIZE)
+    for formula in CACHE_COLLISION:
+        fv = predict.Formula(formula, cache).fv
+        assert fv == predict.Formula(formula).fv, (formula, fv)
+
+
+CHECKS = [check_ws1s_fv, check_cache_collision]
+
+
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./regression.py\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+ Persistent cache of benchmark results.
+ @title resultcache.py
+"""
+
+import sys
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import runner
+import events
+
+#Version 3 caches only results of tasks whose tools all succeeded
+CACHE_VERSION = 3
+
+
+class ResultCache:
+    """
+    On-disk cache of results of tool runs. An entry is keyed by the task (the
+    script and the function parsing the output), the tool invocation, the
+    timeout and the resource limits; every argument naming an existing file (the tool binaries, the
+    formula) is replaced by the hash of its content, so an entry is
+    invalidated once the formula or the binary changes. Only results of
+    tasks whose tools all finished with OK are cached, so timeouts, memory
+    outs and errors are run again.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.hashes = dict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+
+    def file_hash(self, filename):
+        stat = os.stat(filename)
+        ident = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+        if ident not in self.hashes:
+            sha = hashlib.sha256()
+            with open(filename, "rb") as handle:
+                for chunk in iter(lambda: handle.read(1 << 20), b""):
+                    sha.update(chunk)
+            self.hashes[ident] = sha.hexdigest()
+        return self.hashes[ident]
+
+
+    def key(self, fun, argv, timeout):
+        """
+        Get the key of a task. For tasks running several tools, argv is the
+        concatenation of their argument vectors.
+        """
+        args = list()
+        for arg in argv:
+            path = arg if os.path.isfile(arg) else shutil.which(arg)
+            if path is not None and os.path.isfile(path):
+                args.append(["file", self.file_hash(path)])
+            else:
+                args.append(["arg", arg])
+        task = os.path.basename(sys.argv[0]) + ":" + fun.__name__
+        ident = [CACHE_VERSION, task, args, timeout]
+        if any(limit is not None for limit in runner.LIMITS.values()):
+            ident.append(runner.LIMITS)
+        ident = json.dumps(ident, sort_keys=True)
+        return hashlib.sha256(ident.encode()).hexdigest()
+
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key + ".json")
+
+
+    def get(self, key):
+        """
+        Get the cached result (None if there is no entry).
+        """
+        try:
+            with open(self.path(key), "r") as handle:
+                entry = json.load(handle)
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return from_json(entry["result"])
+
+
+    def put(self, key, argv, result):
+        """
+        Store a result. The entry is written atomically, so concurrent runs may
+        share the cache.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as handle:
+            json.dump({"argv": argv, "result": result}, handle)
+        os.replace(tmp, path)
+
+
+    def call(self, argv, timeout, fun, *args):
+        """
+        Get the result of fun(*args) running the tools in argv, computing it
+        only if it is not cached.
+        """
+        key = self.key(fun, argv, timeout)
+        result = self.get(key)
+        if result is None:
+            result, outcome = Tracked(fun)(*args)
+            if outcome == events.OK:
+                self.put(key, argv, result)
+        return result
+
+
+class Tracked:
+    """
+    Task function giving its result along with the outcome of its tools
+    (see events.Task), so that a pool can report whether a result is cached.
+    """
+
+    __slots__ = ("fun",)
+
+    def __init__(self, fun):
+        self.fun = fun
+
+
+    @property
+    def __name__(self):
+        return self.fun.__name__
+
+
+    def __call__(self, *args):
+        with events.tracking() as current:
+            result = self.fun(*args)
+        return result, current.outcome
+
+
+def from_json(value):
+    #Results of the tasks are tuples, JSON gives lists
+    if isinstance(value, list):
+        return tuple(from_json(item) for item in value)
+    return value
+
+
+def run_tasks(cache, tasks, argvs, timeout, jobs=1, cpus=1, skip=None):
+    """
+    Run tasks as runner.run_tasks does, but only those whose results are not
+    in the cache (argvs are the tool invocations of the tasks). Cached
+    results are yielded first. Results of skipped tasks and of tasks whose
+    tools did not all succeed are not cached.
+    """
+    keys = [None]*len(tasks)
+    pending = list()
+    for i in range(len(tasks)):
+        result = None
+        if cache is not None:
+            keys[i] = cache.key(tasks[i][0], argvs[i], timeout)
+            result = cache.get(keys[i])
+        if result is None:
+            pending.append(i)
+        else:
+            yield i, result
+    skipped = set()
+    def skip_pending(j):
+        result = skip(pending[j])
+        if result is not None:
+            skipped.add(j)
+        return result
+
+    for j, result in runner.run_tasks([(Tracked(tasks[i][0]), tasks[i][1]) for i in pending], \
+            jobs, cpus, None if skip is None else skip_pending):
+        if j in skipped:
+            yield pending[j], result
+            continue
+        result, outcome = result
+        if cache is not None and outcome == events.OK:
+            cache.put(keys[pending[j]], argvs[pending[j]], result)
+        yield pending[j], result
+
+
+def cached_call(cache, argv, timeout, fun, *args):
+    """
+    Call fun(*args) through the cache (if there is any).
+    """
+    if cache is None:
+        return fun(*args)
+    return cache.call(argv, timeout, fun, *args)
+
+
+def print_stats(cache):
+    if cache is not None:
+        print("Cache: {0} hits, {1} misses".format(cache.hits, cache.misses))
@@ -0,0 +1,376 @@
+"""
+ Running benchmark tasks in parallel.
+ @title runner.py
+"""
+
+import sys
+import os
+import time
+import signal
+import resource
+import functools
+import threading
+import subprocess
+import multiprocessing
+import tempfile
+import concurrent.futures
+
+import events
+import worker
+
+#ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1024*1024 if sys.platform == "darwin" else 1024
+#Outcome of a tool that ran out of memory (a timeout is reported as TO)
+MEMOUT = "MO"
+#Results of MONA on a prenexed formula whose prenexing (see run_prenex) ran out of time or memory
+PRENEX_TIMEOUT = "TO (prenex)"
+PRENEX_MEMOUT = "MO (prenex)"
+#Exit status of the GHC runtime on heap exhaustion
+HEAP_EXHAUSTED = 251
+#A tool failing with a peak rss of at least this fraction of the memory limit ran out of memory
+MEMORY_MARGIN = 0.9
+#Messages of failed allocations on the standard error (in lower case)
+MEMORY_MESSAGES = [b"memoryerror", b"out of memory", b"cannot allocate memory", b"bad_alloc", \
+    b"heap exhausted"]
+
+#Resource limits of the tools: address space (in MB) and CPU time (in seconds)
+LIMITS = {"memory": None, "cpu": None}
+#Commands of the workers of tools (see worker.py) by the tools
+WORKERS = dict()
+#Running workers of this process (forked processes start their own)
+RUNNING_WORKERS = dict()
+
+
+class MemoryExpired(subprocess.SubprocessError):
+    """
+    Raised when a tool fails after exceeding the memory limit.
+    """
+
+    def __init__(self, cmd, limit, output=None):
+        self.cmd = cmd
+        self.limit = limit
+        self.output = output
+
+
+    def __str__(self):
+        return "Command '{0}' exceeded the memory limit of {1}MB".format(self.cmd, self.limit)
+
+
+class PrenexExpired(subprocess.SubprocessError):
+    """
+    Raised when the prenexing of a formula times out or exceeds the memory
+    limit (outcome is PRENEX_TIMEOUT or PRENEX_MEMOUT).
+    """
+
+    def __init__(self, cmd, outcome, usage):
+        self.cmd = cmd
+        self.outcome = outcome
+        self.usage = usage
+
+
+    def __str__(self):
+        return "Prenexing '{0}' failed: {1}".format(self.cmd, self.outcome)
+
+
+def available_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count()))
+
+
+def cpu_slots(jobs, cpus):
+    """
+    Split the available CPUs into jobs disjoint sets of cpus CPUs each. If
+    there are not enough CPUs, the sets overlap (and timings are no longer
+    comparable).
+    """
+    available = available_cpus()
+    if jobs*cpus > len(available):
+        sys.stderr.write("Warning: {0} jobs with {1} CPUs each, but only {2} CPUs available.\n".format(
+            jobs, cpus, len(available)))
+    return [{available[(i*cpus + k) % len(available)] for k in range(cpus)} for i in range(jobs)]
+
+
+def pin_worker(slots, limits, target, workers):
+    LIMITS.update(limits)
+    WORKERS.update(workers)
+    events.set_target(target)
+    pin_process(slots.get())
+
+
+def pin_process(cpus):
+    """
+    Pin this process to cpus (if the platform supports it). Returns the
+    previous affinity.
+    """
+    try:
+        affinity = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+        return affinity
+    except AttributeError:
+        return cpus
+
+
+def run_tasks(tasks, jobs=1, cpus=1, skip=None):
+    """
+    Run tasks given as a list of pairs (function, arguments). With more than
+    one job, the tasks are run in a pool of worker processes, each of them
+    pinned to its own set of cpus CPUs (tools started by a task inherit the
+    affinity and the limits); a single job runs them in this process pinned
+    to the first set for the run. Yields pairs (index of the task, result) as the tasks finish.
+    Every task emits its start and end events. Tasks are started in their
+    order, at most jobs at a time; if skip(i) gives a result just before
+    task i would start, the task is not run and the result is yielded.
+    """
+    events.sweep(len(tasks))
+    if jobs <= 1:
+        affinity = pin_process(cpu_slots(1, cpus)[0])
+        try:
+            for i, (fun, args) in enumerate(tasks):
+                result = None if skip is None else skip(i)
+                yield i, run_task(fun, args) if result is None else skipped(fun, args, result)
+        finally:
+            pin_process(affinity)
+        events.finish()
+        return
+
+    slots = multiprocessing.Queue()
+    for slot in cpu_slots(jobs, cpus):
+        slots.put(slot)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=pin_worker, \
+            initargs=(slots, dict(LIMITS), events.TARGET, dict(WORKERS))) as pool:
+        #Tasks are submitted as workers get free, so skip sees the results so far
+        waiting = iter(enumerate(tasks))
+        running = dict()
+        while True:
+            for i, (fun, args) in waiting:
+                result = None if skip is None else skip(i)
+                if result is not None:
+                    yield i, skipped(fun, args, result)
+                    continue
+                running[pool.submit(run_task, fun, args)] = i
+                if len(running) >= jobs:
+                    break
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+    events.finish()
+
+
+def run_task(fun, args):
+    with events.task(events.describe(fun, args)):
+        return fun(*args)
+
+
+def skipped(fun, args, result):
+    events.skipped(events.describe(fun, args))
+    return result
+
+
+def formula_file(formula=""):
+    """
+    Create a fresh temporary file holding a formula (deleted once closed), so
+    that concurrent runs never share a file.
+    """
+    f = tempfile.NamedTemporaryFile(mode="w", prefix="formula-", suffix=".mona")
+    f.write(formula)
+    f.flush()
+    return f
+
+
+def run_tool(argv, timeout, stdout=subprocess.PIPE):
+    """
+    Run a tool as subprocess.check_output does and measure the resources used
+    by the child (see get_usage). The child runs under LIMITS (see
+    set_limits). Returns the output (None if stdout is redirected) and the
+    usage. On a timeout (or exceeding the CPU limit), running out of memory or
+    a nonzero exit status, TimeoutExpired, MemoryExpired or CalledProcessError
+    is raised with the usage stored in its usage attribute. The tool is
+    recorded in the events of the running task. A tool with a worker (see
+    set_worker) is run on the worker.
+    """
+    if argv[0] in WORKERS:
+        return run_on_worker(argv, timeout, stdout)
+    limits = dict(LIMITS)
+    preexec = None
+    if limits["memory"] is not None or limits["cpu"] is not None:
+        preexec = functools.partial(apply_limits, limits)
+    start = time.monotonic()
+    #Under a memory limit, the standard error is checked for failed allocations
+    stderr = None if limits["memory"] is None else subprocess.PIPE
+    proc = subprocess.Popen(argv, stdout=stdout, stderr=stderr, preexec_fn=preexec)
+    expired = threading.Event()
+    timer = threading.Timer(timeout, kill_expired, [proc, expired])
+    timer.start()
+    errors = list()
+    if proc.stderr is not None:
+        reader = threading.Thread(target=lambda: errors.append(proc.stderr.read()))
+        reader.start()
+    output = None
+    if proc.stdout is not None:
+        output = proc.stdout.read()
+        proc.stdout.close()
+    if proc.stderr is not None:
+        reader.join()
+        proc.stderr.close()
+        sys.stderr.buffer.write(errors[0])
+        sys.stderr.flush()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    timer.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    usage = get_usage(rusage, time.monotonic() - start)
+
+    #The timer may fire after the tool exits, only a tool it killed timed out
+    if (expired.is_set() and proc.returncode == -signal.SIGKILL) or \
+            cpu_exceeded(proc.returncode, usage, limits):
+        outcome = events.TIMEOUT
+    elif memory_exceeded(proc.returncode, usage, b"".join(errors), limits):
+        outcome = MEMOUT
+    elif proc.returncode != 0:
+        outcome = events.ERROR
+    else:
+        outcome = events.OK
+    return tool_result(argv, timeout, limits, outcome, proc.returncode, output, usage)
+
+
+def run_on_worker(argv, timeout, stdout):
+    """
+    Run a tool as run_tool does, on the worker of the tool. The usage has
+    also the overhead: the wall time of the request beyond the wall time of
+    solving the formula.
+    """
+    limits = dict(LIMITS)
+    pid = os.getpid()
+    if (pid, argv[0]) not in RUNNING_WORKERS:
+        RUNNING_WORKERS[(pid, argv[0])] = worker.Worker(WORKERS[argv[0]])
+    response, wall = RUNNING_WORKERS[(pid, argv[0])].request(argv[1:], timeout, limits)
+    usage = dict(response["usage"])
+    usage["overhead"] = max(0.0, wall - usage["wall"])
+    output = response["output"].encode("utf-8", worker.ERRORS)
+    if stdout is not subprocess.PIPE:
+        stdout.flush()
+        os.write(stdout.fileno(), output)
+        output = None
+    return tool_result(argv, timeout, limits, response["outcome"], response["status"], output, usage)
+
+
+def run_prenex(argv, timeout, stdout=subprocess.PIPE):
+    """
+    Run the prenexing of a formula by the lazy tool as run_tool does. Its
+    timeouts and memory outs are raised as PrenexExpired, so that they are
+    not reported as the ones of MONA on the prenexed formula.
+    """
+    try:
+        return run_tool(argv, timeout, stdout)
+    except subprocess.TimeoutExpired as e:
+        raise PrenexExpired(argv, PRENEX_TIMEOUT, e.usage) from e
+    except MemoryExpired as e:
+        raise PrenexExpired(argv, PRENEX_MEMOUT, e.usage) from e
+
+
+def tool_result(argv, timeout, limits, outcome, returncode, output, usage):
+    events.tool(argv, outcome, usage)
+    if outcome == events.OK:
+        return output, usage
+    if outcome == events.TIMEOUT:
+        err = subprocess.TimeoutExpired(argv, timeout, output)
+    elif outcome == MEMOUT:
+        err = MemoryExpired(argv, limits["memory"], output)
+    else:
+        err = subprocess.CalledProcessError(returncode, argv, output)
+    err.usage = usage
+    raise err
+
+
+def kill_expired(proc, expired):
+    expired.set()
+    proc.kill()
+
+
+def set_limits(memory=None, cpu=None):
+    """
+    Set the limits of the tools started by run_tool: the address space in MB
+    (RLIMIT_AS) and the CPU time in seconds (RLIMIT_CPU).
+    """
+    LIMITS["memory"] = memory
+    LIMITS["cpu"] = cpu
+
+
+def set_worker(tool, command):
+    """
+    Run the tool on a worker started by the command (a list) from now on.
+    """
+    WORKERS[tool] = command
+
+
+def format_workers():
+    workers = [item for (pid, _), item in RUNNING_WORKERS.items() if pid == os.getpid()]
+    if not workers:
+        return "none"
+    return ", ".join("{0} ({1} requests, startup {2:.3f}s)".format(" ".join(item.argv), \
+        item.requests, item.startup or 0.0) for item in workers)
+
+
+def apply_limits(limits):
+    #Run in the child between fork and exec
+    if limits["memory"] is not None:
+        size = limits["memory"]*1024*1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if limits["cpu"] is not None:
+        #SIGXCPU at the soft limit, SIGKILL a second later
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"] + 1))
+
+
+def cpu_exceeded(returncode, usage, limits):
+    if limits["cpu"] is None:
+        return False
+    return returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and \
+        usage["user"] + usage["sys"] >= limits["cpu"])
+
+
+def memory_exceeded(returncode, usage, errors, limits):
+    """
+    A tool under a memory limit that fails ran out of memory if its peak rss
+    reached the limit (up to MEMORY_MARGIN), it reports a failed allocation
+    on the standard error or, for the lazy tool, by the heap exhaustion exit
+    status. Other failures (signals included) are errors.
+    """
+    if limits["memory"] is None or returncode == 0:
+        return False
+    return returncode == HEAP_EXHAUSTED or usage["rss"] >= MEMORY_MARGIN*limits["memory"] or \
+        any(message in errors.lower() for message in MEMORY_MESSAGES)
+
+
+def format_limits():
+    limits = list()
+    if LIMITS["memory"] is not None:
+        limits.append("{0}MB memory".format(LIMITS["memory"]))
+    if LIMITS["cpu"] is not None:
+        limits.append("{0}s CPU".format(LIMITS["cpu"]))
+    return ", ".join(limits) if limits else "none"
+
+
+def get_usage(rusage, wall):
+    """
+    Resource usage of a child: user and system CPU time, wall clock time (all
+    in seconds) and peak resident set size (in MB).
+    """
+    return {
+        "user": rusage.ru_utime,
+        "sys": rusage.ru_stime,
+        "wall": wall,
+        "rss": rusage.ru_maxrss / RSS_UNIT,
+    }
+
+
+def format_usage(usage):
+    if usage is None:
+        return "N/A"
+    formatted = "{0:.2f}s+{1:.2f}s cpu {2:.2f}s wall {3:.1f}MB".format(usage["user"], \
+        usage["sys"], usage["wall"], usage["rss"])
+    if "overhead" in usage:
+        formatted += " {0:.3f}s overhead".format(usage["overhead"])
+    return formatted
@@ -0,0 +1,79 @@
+"""
+ Scheduling of the formulas of parametric series (files of a folder that
+ differ only in a number, e.g. horn-sub-3alt03..20). Instances of a series
+ get harder with the number, so cheaper instances run first and the larger
+ instances of a series are not run by a tool once a smaller one timed out.
+ @title schedule.py
+"""
+
+import os
+import re
+
+#Name of a formula file in a series: prefix, index and suffix
+SERIES = re.compile(r"^(.*?)(\d+)(\D*)$")
+#Time of a result implied by a timeout of a smaller instance
+IMPLIED = "TO (implied)"
+
+
+def series(filename):
+    """
+    Get the series of a formula file (its folder and its name without the
+    number) and its index in the series (None, 0 if it is not in a series).
+    """
+    folder, base = os.path.split(filename)
+    match = SERIES.match(os.path.splitext(base)[0])
+    if match is None:
+        return None, 0
+    return (folder, match.group(1), match.group(3)), int(match.group(2))
+
+
+class Scheduler:
+    """
+    Order of tasks given by their keys (tool, formula file): by the index of
+    the formula in its series, the order of the tasks otherwise. Task j of
+    the order is skipped with the result implied if the same tool timed out
+    on a smaller instance of its series (timed_out tells timeouts from
+    results), unless implying is off.
+    """
+
+    __slots__ = ("order", "series", "indices", "timeouts", "timed_out", "implied", "skipped")
+
+    def __init__(self, keys, timed_out, implied, imply=True):
+        self.series = list()
+        self.indices = list()
+        for tool, filename in keys:
+            name, index = series(filename)
+            self.series.append(None if name is None or not imply else (tool,) + name)
+            self.indices.append(index)
+        self.order = sorted(range(len(keys)), key=lambda i: (self.indices[i], i))
+        #The smallest index timed out by the series of tools
+        self.timeouts = dict()
+        self.timed_out = timed_out
+        self.implied = implied
+        self.skipped = 0
+
+
+    def tasks(self, items):
+        return [items[i] for i in self.order]
+
+
+    def skip(self, j):
+        """
+        Get the implied result of task j of the order (None if it is run).
+        """
+        i = self.order[j]
+        if self.series[i] is None or self.timeouts.get(self.series[i], self.indices[i]) >= self.indices[i]:
+            return None
+        self.skipped += 1
+        return self.implied
+
+
+    def done(self, j, result):
+        """
+        Record the result of task j of the order. Returns the index of the task.
+        """
+        i = self.order[j]
+        if self.series[i] is not None and result is not self.implied and self.timed_out(result):
+            self.timeouts[self.series[i]] = min(self.timeouts.get(self.series[i], self.indices[i]), \
+                self.indices[i])
+        return i
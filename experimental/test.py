@@ -17,14 +17,20 @@ def main():
 
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.connect(('localhost', SOCKET_NR))
-    s.sendall(sys.argv[1].encode())
+    #More files are sent as one batch
+    files = sys.argv[1:]
+    if len(files) > 1:
+        files = ["batch {0}".format(len(files))] + files
+    s.sendall("".join(f + "\n" for f in files).encode())
 
     if sys.argv[1] == "stop":
         sys.exit(0)
-    
-    response = s.recv(1024).decode()
+
+    #The response is a line for every file
+    with s.makefile("rb") as response:
+        for _ in sys.argv[1:]:
+            print(response.readline().decode().rstrip("\n"))
     s.close()
-    print(response)
 
 
 if __name__ == "__main__":
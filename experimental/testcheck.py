@@ -7,6 +7,7 @@
 """
 
 import sys
+import getopt
 import subprocess
 import string
 import re
@@ -16,18 +17,34 @@ import resource
 
 from termcolor import colored
 
+import resultcache
+import runner
+import events
+
 VALIDLINE = -3
 TIMELINE = -1
 TIMEOUT=50 #in seconds
 COLOR=True
 
 def main():
-    if len(sys.argv) != 3:
-        sys.stderr.write("Bad input arguments. \nFormat: ./testcheck [program] [formula folder]\n")
+    if len(sys.argv) < 3:
+        help_err()
+        sys.exit()
+    try:
+        opts, _ = getopt.getopt(sys.argv[3:], "", ["cache=", "events="])
+    except getopt.GetoptError as _:
+        help_err()
         sys.exit()
 
     program = sys.argv[1]
     formulafolder = sys.argv[2]
+    cache = None
+
+    for o, a in opts:
+        if o == "--cache":
+            cache = resultcache.ResultCache(a)
+        if o == "--events":
+            events.set_target(a)
 
     files = [f for f in os.listdir(formulafolder) \
         if os.path.isfile(os.path.join(formulafolder, f)) and \
@@ -35,24 +52,26 @@ def main():
 
     success = True
 
+    events.sweep(len(files))
     for monafile in files:
         filename = os.path.join(formulafolder, monafile)
-        try:
-            program_output = subprocess.check_output([program, filename], timeout=TIMEOUT).decode("utf-8")
-            #time = resource.getrusage(resource.RUSAGE_CHILDREN).ru_utime
-        except subprocess.TimeoutExpired:
-            print("Timeout expired: {0}; Time: {1}s".format(monafile, TIMEOUT))
+        with events.task(filename):
+            validline, timeline, usage = resultcache.cached_call(cache, [program, filename], TIMEOUT, \
+                run_program, program, filename)
+        if validline is None:
+            print("Timeout expired: {0}; Time: {1}s; {2}".format(monafile, TIMEOUT, runner.format_usage(usage)))
             continue
-        lines = program_output.split('\n')
-        lines = list(filter(None, lines)) #Remove empty lines
         valid = file_formula_valid(filename)
-        if (lines[VALIDLINE] == "valid" and valid) or (lines[VALIDLINE] == "unsatisfiable" and not valid):
+        if (validline == "valid" and valid) or (validline == "unsatisfiable" and not valid):
             correct = colored("Correct:", "green") if COLOR else "Correct:"
-            print(correct, " {0: <25} {1}".format(monafile, lines[TIMELINE]))
+            print(correct, " {0: <25} {1} [{2}]".format(monafile, timeline, runner.format_usage(usage)))
         else:
             fail = colored("Fail:", "red") if COLOR else "Fail:"
-            print(fail, " {0: <25} {1}".format(monafile, lines[TIMELINE]))
+            print(fail, " {0: <25} {1} [{2}]".format(monafile, timeline, runner.format_usage(usage)))
             success = False
+    events.finish()
+
+    resultcache.print_stats(cache)
 
     if success:
         sys.exit(0)
@@ -60,6 +79,16 @@ def main():
         sys.exit(1)
 
 
+def run_program(program, filename):
+    try:
+        program_output, usage = runner.run_tool([program, filename], TIMEOUT)
+    except subprocess.TimeoutExpired as e:
+        return None, None, e.usage
+    lines = program_output.decode("utf-8").split('\n')
+    lines = list(filter(None, lines)) #Remove empty lines
+    return lines[VALIDLINE], lines[TIMELINE], usage
+
+
 def parse_validity(content):
     p = re.compile(r'^#\s*Validity:\s*(?P<valid>\w*)')
     lines = content.split('\n')
@@ -83,5 +112,10 @@ def file_formula_valid(filename):
     return parse_validity(content)
 
 
+def help_err():
+    sys.stderr.write("Bad input arguments. \nFormat: ./testcheck [program] [formula folder] [--cache=DIR] " +
+                     "[--events=FILE|tcp:HOST:PORT]\n")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+"""
+ Persistent processes of tools (workers) solving many formulas, so that the
+ startup of a tool is paid once per run instead of once per formula.
+
+ Protocol (JSON lines over the standard input and output of the worker):
+ the worker prints {"ready": true} once it is initialized. For every request
+ {"args": [...], "timeout": seconds, "limits": {"memory": MB, "cpu": seconds}}
+ (args are the arguments of a single run of the tool, the formula included)
+ it prints {"outcome": "OK"|"TO"|"MO"|"ERROR", "status": exit status,
+ "output": output, "usage": usage of the formula (see runner.get_usage)}.
+ The worker exits at the end of its input.
+ @title worker.py
+"""
+
+import sys
+import os
+import json
+import signal
+import time
+import threading
+import subprocess
+
+#Seconds a worker gets over the timeout of a request before it is killed
+GRACE = 5
+#Output that is not UTF-8 is kept as surrogates in JSON
+ERRORS = "surrogateescape"
+
+
+class WorkerError(subprocess.SubprocessError):
+    """
+    Raised when a worker exits or breaks the protocol.
+    """
+
+    def __init__(self, cmd, reason):
+        self.cmd = cmd
+        self.reason = reason
+
+
+    def __str__(self):
+        return "Worker '{0}' failed: {1}".format(self.cmd, self.reason)
+
+
+class Worker:
+    """
+    Client of a worker started by argv when it gets its first request (and
+    again after it is killed). The worker runs in its own process group,
+    which is killed as a whole, so that no tool it started is left running.
+    """
+
+    __slots__ = ("argv", "proc", "startup", "requests")
+
+    def __init__(self, argv):
+        self.argv = argv
+        self.proc = None
+        #Seconds to start the worker (the last start)
+        self.startup = None
+        self.requests = 0
+
+
+    def start(self):
+        start = time.monotonic()
+        self.proc = subprocess.Popen(self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, \
+            encoding="utf-8", start_new_session=True)
+        if not self.receive().get("ready"):
+            self.stop()
+            raise WorkerError(self.argv, "not ready")
+        self.startup = time.monotonic() - start
+
+
+    def stop(self):
+        if self.proc is not None:
+            kill_group(self.proc)
+            self.proc.wait()
+            self.proc = None
+
+
+    def receive(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            return dict()
+        try:
+            return json.loads(line)
+        except ValueError:
+            return dict()
+
+
+    def request(self, args, timeout, limits):
+        """
+        Solve a formula. Returns the response and the wall time of the
+        request. A worker that does not respond in time is killed and the
+        request times out.
+        """
+        if self.proc is None:
+            self.start()
+        self.requests += 1
+        start = time.monotonic()
+        expired = threading.Event()
+        timer = threading.Timer(timeout + GRACE, kill_expired, [self.proc, expired])
+        timer.start()
+        try:
+            self.proc.stdin.write(json.dumps({"args": args, "timeout": timeout, "limits": limits}) + "\n")
+            self.proc.stdin.flush()
+            response = self.receive()
+        except OSError:
+            response = dict()
+        finally:
+            timer.cancel()
+        wall = time.monotonic() - start
+        if "outcome" in response:
+            return response, wall
+        self.stop()
+        if expired.is_set():
+            return {"outcome": "TO", "status": None, "output": "", \
+                "usage": {"user": 0.0, "sys": 0.0, "wall": wall, "rss": 0.0}}, wall
+        raise WorkerError(self.argv, "no response")
+
+
+def kill_expired(proc, expired):
+    expired.set()
+    kill_group(proc)
+
+
+def kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def response(outcome, status, output, usage):
+    return {"outcome": outcome, "status": status, \
+        "output": "" if output is None else output.decode("utf-8", ERRORS), "usage": usage}
+
+
+def serve(solve):
+    """
+    Serve the requests of the standard input by solve(request), which gives
+    the response.
+    """
+    print(json.dumps({"ready": True}), flush=True)
+    for line in sys.stdin:
+        print(json.dumps(solve(json.loads(line))), flush=True)